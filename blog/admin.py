@@ -5,7 +5,7 @@ from .models import Post, Comment
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
-    list_display = ('title', 'created_at', 'updated_at')
+    list_display = ('title', 'comment_count', 'created_at', 'updated_at')
     list_filter = ('created_at', 'updated_at')
     search_fields = ('title', 'content')
 
@@ -13,5 +13,9 @@ class PostAdmin(admin.ModelAdmin):
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
     list_display = ('post', 'text', 'email')
+    list_select_related = ('post',)
     list_filter = ('post',)
-    search_fields = ('text', 'email')
\ No newline at end of file
+    search_fields = ('text', 'email')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('post').only('id', 'text', 'email', 'post__id', 'post__title')
@@ -0,0 +1,67 @@
+"""
+Archival of old comments.
+
+`manage.py archive_comments` moves comments older than
+BLOG_COMMENT_ARCHIVE_DAYS from the comment table to ArchivedComment, a batch
+per transaction, keeping their ids. The comment table then only holds recent
+comments, so its indexes stay small enough to be cached, and vacuum has less
+to do. Post.comment_count still counts a post's archived comments.
+
+A post's comments are read from both tables (see `post_comments`), a keyset
+page at a time. Each page is one index range scan per table on (post, id),
+with the two results merged. The comment export reads both tables too (see
+`all_comments`); the list of all comments and search read recent comments only.
+Archived comments are never written again, except when their post is deleted
+and they cascade with it.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+
+from .models import ArchivedComment, Comment
+
+ARCHIVED_FIELDS = ('id', 'post_id', 'text', 'email', 'created_at')
+
+
+def cutoff(days=None):
+    return timezone.now() - timedelta(days=settings.BLOG_COMMENT_ARCHIVE_DAYS if days is None else days)
+
+
+def archive_batch(before, batch_size=1000):
+    """Moves up to `batch_size` of the oldest comments created before `before`; returns how many moved."""
+    using = router.db_for_write(Comment)
+    with transaction.atomic(using=using):
+        # Another archiver skips the rows this one holds instead of waiting for them.
+        rows = list(Comment.objects.using(using).filter(created_at__lt=before).order_by('created_at')
+                    .select_for_update(skip_locked=True).values_list(*ARCHIVED_FIELDS)[:batch_size])
+        if not rows:
+            return 0
+        ArchivedComment.objects.using(using).bulk_create(
+            [ArchivedComment(**dict(zip(ARCHIVED_FIELDS, row))) for row in rows])
+        Comment.objects.using(using).filter(pk__in=[row[0] for row in rows]).delete(update_counts=False)
+    return len(rows)
+
+
+def archive(before, batch_size=1000):
+    """Moves every comment created before `before`, a batch at a time; yields the size of each batch."""
+    while True:
+        moved = archive_batch(before, batch_size)
+        if moved:
+            yield moved
+        if moved < batch_size:
+            return
+
+
+def all_comments():
+    """The recent and the archived comments, for the export to read as one."""
+    return [Comment.objects.all(), ArchivedComment.objects.all()]
+
+
+def post_comments(post, embed_post=False):
+    """The recent and the archived comments of `post`, for Keyset.paginate to read as one."""
+    return [
+        Comment.objects.filter(post=post).for_api(embed_post),
+        ArchivedComment.objects.filter(post=post).for_api(embed_post),
+    ]
@@ -0,0 +1,170 @@
+from functools import wraps
+from typing import List, Literal, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404
+from ninja import NinjaAPI, Query, Schema
+from ninja.errors import HttpError
+
+from .archive import post_comments
+from .feed import afeed_page
+from .fieldsets import POST_FIELDS, columns, ninja_fields, select_fields
+from .models import Comment, Post
+from .pagination import COMMENT_KEYSET, POST_KEYSET, InvalidCursor, apaginate
+from .push import CommentStream, TooManySubscribers
+from .ratelimit import RateLimited, rate_limited, rate_limited_response
+from .renderers import ninja_renderer
+from .views import (CommentCreatedSchema, CommentOutSchema, CommentQueuedSchema,
+                    CommentSchema, PostInSchema, PostOutSchema)
+from .writebehind import QUEUE_FULL, RETRY_AFTER, QueueFull, enqueue_comment
+
+# Async counterparts of the Ninja API in views.py, for ASGI deployments: the
+# handlers await the ORM instead of holding a worker thread for the whole request.
+api = NinjaAPI(title='Blog API (async)', urls_namespace='async_api',
+                renderer=ninja_renderer())
+
+@api.exception_handler(RateLimited)
+def rate_limit_exceeded(request, exc):
+    return rate_limited_response(api, request, exc)
+
+
+def alogin_required(view):
+    """`login_required` for coroutine views, resolving the session user with `request.auser()`."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+class PostPageSchema(Schema):
+    next: Optional[str] = None
+    results: List[PostOutSchema]
+
+class CommentPageSchema(Schema):
+    next: Optional[str] = None
+    results: List[CommentOutSchema]
+
+@api.get('/posts', response=PostPageSchema, exclude_unset=True, tags=['posts'], description="List all posts")
+@rate_limited('read')
+@alogin_required
+async def list_posts(request, cursor: str = None, limit: int = Query(None, ge=1), fields: str = None):
+    fields = ninja_fields(fields)
+    queryset = Post.objects.values(*columns(fields))
+    return select_fields(await apaginate(POST_KEYSET, queryset, request, cursor, limit), fields)
+
+@api.get("/feed", tags=['posts'], description="The latest posts with excerpts and comment counts")
+@rate_limited('read')
+@alogin_required
+async def get_feed(request, cursor: str = None, limit: int = Query(None, ge=1)):
+    try:
+        return HttpResponse(await afeed_page(request, cursor, limit), content_type='application/json')
+    except InvalidCursor:
+        raise HttpError(404, 'Invalid cursor')
+
+@api.get("/comments", response=CommentPageSchema, tags=['comments'], description="List all comments")
+@rate_limited('read')
+@alogin_required
+async def list_comments(request, cursor: str = None, limit: int = Query(None, ge=1),
+                        expand: Literal['post'] = None):
+    queryset = Comment.objects.for_api(embed_post=expand == 'post')
+    return await apaginate(COMMENT_KEYSET, queryset, request, cursor, limit)
+
+@api.post("/posts", tags=['posts'])
+@rate_limited('write')
+@alogin_required
+async def create_post(request, payload: PostInSchema):
+    """
+    To create a post please provide:
+    - **title**
+    - **content**
+    """
+    post = await Post.objects.acreate(**payload.dict())
+    return {"id": post.id}
+
+@api.post("/comments", response={200: CommentCreatedSchema, 202: CommentQueuedSchema}, tags=['comments'])
+@rate_limited('write')
+@alogin_required
+async def create_comment(request, payload: CommentSchema):
+    """
+    To create a comment please provide:
+    - **post_id**
+    - **text**
+    - **email**
+
+    With write-behind on, the comment is queued and the answer is a 202 with its ticket.
+    """
+    if settings.BLOG_WRITE_BEHIND:
+        try:
+            # Off the shared thread: a queue push waits on disk or Redis.
+            ticket = await sync_to_async(enqueue_comment, thread_sensitive=False)(payload.dict())
+        except QueueFull:
+            response = api.create_response(request, {"detail": QUEUE_FULL}, status=503)
+            response['Retry-After'] = str(RETRY_AFTER)
+            return response
+        return 202, {"id": ticket, "status": "queued"}
+    comment = await Comment.objects.acreate(**payload.dict())
+    return {"id": comment.id}
+
+@api.put("/posts/{int:post_id}", tags=['posts'])
+@rate_limited('write')
+@alogin_required
+async def update_post(request, post_id: int, payload: PostInSchema):
+    """
+    To update a post please provide:
+    - **post_id**
+    - **title**
+    - **content**
+    """
+    post = await aget_object_or_404(Post, id=post_id)
+    for attr, value in payload.dict().items():
+        if value is not None:
+            setattr(post, attr, value)
+    await post.asave()
+    return {"success": True}
+
+@api.get("/posts/{int:post_id}/comments", response=CommentPageSchema, tags=['comments'],
+         description="List the comments of a post")
+@rate_limited('read')
+@alogin_required
+async def list_post_comments(request, post_id: int, cursor: str = None, limit: int = Query(None, ge=1),
+                             expand: Literal['post'] = None):
+    post = await aget_object_or_404(Post.objects.only('id'), id=post_id)
+    return await apaginate(COMMENT_KEYSET, post_comments(post, embed_post=expand == 'post'), request, cursor, limit)
+
+@api.get("/posts/{int:post_id}/comments/stream", tags=['comments'],
+         description="New comments on a post as Server-Sent Events")
+@rate_limited('read')
+@alogin_required
+async def stream_post_comments(request, post_id: int):
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI the response would drain this endless stream before sending it, holding a worker thread.
+        raise HttpError(501, 'Comment streams need the ASGI server (manage.py serve --asgi)')
+    await aget_object_or_404(Post.objects.only('id'), id=post_id)
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    try:
+        stream = CommentStream(post_id, int(last_event_id) if last_event_id.isdigit() else None)
+    except TooManySubscribers:
+        raise HttpError(503, 'Too many subscribers, retry later')
+    return StreamingHttpResponse(stream, content_type='text/event-stream',
+                                 headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@api.get("/posts/{int:post_id}", response=PostOutSchema, exclude_unset=True, tags=['posts'], description="Get a post")
+@rate_limited('read')
+@alogin_required
+async def get_post(request, post_id: int, fields: str = None):
+    return await aget_object_or_404(Post.objects.values(*ninja_fields(fields) or POST_FIELDS), id=post_id)
+
+@api.delete("/posts/{int:post_id}", tags=['posts'], description="Delete a post")
+@rate_limited('write')
+@alogin_required
+async def delete_post(request, post_id: int):
+    post = await aget_object_or_404(Post, id=post_id)
+    await post.adelete()
+    return {"success": True}
@@ -0,0 +1,106 @@
+"""
+Authentication that reads users and API tokens from the cache instead of the
+database on every request.
+
+Tokens and users are cached separately: a token entry holds the id of its user
+and the user entry holds the user's columns, so changing or deactivating a user
+drops one entry whatever the number of tokens or sessions they have. Entries
+are dropped by signal receivers when a token is deleted or a user is saved,
+deleted or logged out, and expire after BLOG_AUTH_CACHE_TIMEOUT in any case
+(so a queryset `.update()` on users takes effect within that time).
+Sessions themselves are cached by the `cached_db` session engine. The password
+hash never enters the cache: a cached user holds its session auth hash instead,
+and loads the password from the database only if something reads it.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from .cache import get_cache
+
+TOKEN_KEY = 'blog:auth:token:{}'
+USER_KEY = 'blog:auth:user:{}'
+
+
+def token_key(key):
+    # Hashed, so the cache never holds usable credentials in its key space.
+    return TOKEN_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+def user_key(user_id):
+    return USER_KEY.format(get_user_model()._meta.pk.to_python(user_id))
+
+
+def _cached_fields():
+    return [field.attname for field in get_user_model()._meta.concrete_fields if field.attname != 'password']
+
+
+def user_entry(user):
+    """What the cache holds of `user`: every column but the password, and the session auth hash."""
+    return [getattr(user, name) for name in _cached_fields()], user.get_session_auth_hash()
+
+
+def _from_entry(entry):
+    values, session_auth_hash = entry
+    # The password is left deferred, so saving this user never writes it.
+    user = get_user_model().from_db(DEFAULT_DB_ALIAS, _cached_fields(), values)
+    user.get_session_auth_hash = lambda: session_auth_hash
+    return user
+
+
+def cached_user(user_id):
+    """The user with primary key `user_id`, active or not, or None if there is none."""
+    cache = get_cache()
+    key = user_key(user_id)
+    entry = cache.get(key)
+    if entry is not None:
+        return _from_entry(entry)
+    user = get_user_model()._default_manager.filter(pk=user_id).first()
+    if user is not None:
+        cache.set(key, user_entry(user), settings.BLOG_AUTH_CACHE_TIMEOUT)
+    return user
+
+
+def forget_user(user_id):
+    get_cache().delete(user_key(user_id))
+
+
+def forget_token(key):
+    get_cache().delete(token_key(key))
+
+
+# Django Rest Framework
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cache = get_cache()
+        entry = cache.get(token_key(key))
+        if entry is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set_many({
+                token_key(key): (token.user_id, token.created),
+                user_key(user.pk): user_entry(user),
+            }, settings.BLOG_AUTH_CACHE_TIMEOUT)
+            return user, token
+
+        user_id, created = entry
+        user = cached_user(user_id)
+        if user is None or not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        token = self.get_model()(key=key, user_id=user_id, created=created)
+        token.user = user
+        return user, token
+
+
+# Sessions, for Django Ninja and DRF's SessionAuthentication
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose per-request user lookup (`get_user`) goes through the cache."""
+
+    def get_user(self, user_id):
+        user = cached_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
@@ -0,0 +1 @@
+"""Django's database backends with connections taken from blog.pool (DB_POOL_SIZE)."""
@@ -0,0 +1,7 @@
+from django.db.backends.postgresql import base
+
+from blog.pool import PooledDatabaseWrapper
+
+
+class DatabaseWrapper(PooledDatabaseWrapper, base.DatabaseWrapper):
+    pass
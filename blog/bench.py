@@ -0,0 +1,210 @@
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Latencies in seconds → the figures every benchmark reports, in milliseconds."""
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+@contextmanager
+def scratch_database(verbosity=0):
+    """
+    Runs the block against throwaway test databases, the way `manage.py test`
+    does, so benchmarks never seed into or time against real data. Rate limits
+    are off inside it: a benchmark is one client sending as fast as it can.
+    """
+    from django.test.utils import (override_settings, setup_databases,
+                                   setup_test_environment, teardown_databases,
+                                   teardown_test_environment)
+
+    # An on-disk SQLite file rather than the shared in-memory test database, so
+    # concurrent writers wait on the file lock instead of failing outright.
+    scratch = []
+    for alias in connections:
+        settings_dict = connections[alias].settings_dict
+        if connections[alias].vendor == 'sqlite' and not settings_dict['TEST'].get('NAME'):
+            handle, name = tempfile.mkstemp(suffix='.sqlite3', prefix=f'bench_{alias}_')
+            os.close(handle)
+            settings_dict['TEST']['NAME'] = name
+            scratch.append((settings_dict, name))
+
+    setup_test_environment(debug=False)
+    old_config = setup_databases(verbosity=verbosity, interactive=False)
+    try:
+        with override_settings(BLOG_RATELIMIT=False):
+            yield
+    finally:
+        connections.close_all()
+        teardown_databases(old_config, verbosity=verbosity)
+        teardown_test_environment()
+        for settings_dict, name in scratch:
+            settings_dict['TEST'].pop('NAME', None)
+            if os.path.exists(name):
+                os.remove(name)
+
+
+Endpoint = namedtuple('Endpoint', 'name method path body', defaults=(None,))
+
+POST_BODY = {'title': 'Benchmark post', 'content': 'Benchmark content ' * 20}
+COMMENT_BODY = {'text': 'Benchmark comment', 'email': 'bench@example.com'}
+
+# Bulk updates touch 50 different posts: a batch that repeats an id is rejected item by item.
+BULK_UPDATE_BODY = [{**POST_BODY, 'id': f'{{post_id_{i}}}'} for i in range(50)]
+
+# Every route of blog/urls.py except the DELETEs, single and bulk, which cannot be repeated
+# against the same rows, and the comment event stream, which never ends.
+ENDPOINTS = [
+    Endpoint('drf:post-list', 'get', '/api/posts/'),
+    Endpoint('drf:post-list-page2', 'get', '/api/posts/?cursor={cursor}'),
+    Endpoint('drf:post-list-sparse', 'get', '/api/posts/?fields=id,title,excerpt,created_at'),
+    Endpoint('drf:post-detail', 'get', '/api/posts/{post_id}/'),
+    Endpoint('drf:post-comment-list', 'get', '/api/posts/{post_id}/comments/'),
+    Endpoint('drf:comment-list', 'get', '/api/comments/'),
+    Endpoint('drf:article-list', 'get', '/api/articles/'),
+    Endpoint('drf:article-detail', 'get', '/api/articles/{post_id}/'),
+    Endpoint('drf:search', 'get', '/api/search/?q=benchmark'),
+    Endpoint('drf:feed', 'get', '/api/feed/'),
+    Endpoint('drf:post-export', 'get', '/api/posts/export/'),
+    Endpoint('drf:comment-export', 'get', '/api/comments/export/'),
+    Endpoint('drf:cache-stats', 'get', '/api/cache/stats/'),
+    Endpoint('drf:metrics', 'get', '/api/metrics/'),
+    Endpoint('drf:post-create', 'post', '/api/posts/create/', POST_BODY),
+    Endpoint('drf:article-create', 'post', '/api/articles/', POST_BODY),
+    Endpoint('drf:post-update', 'put', '/api/posts/{post_id}/update/', POST_BODY),
+    Endpoint('drf:article-update', 'put', '/api/articles/{post_id}/', POST_BODY),
+    Endpoint('drf:comment-create', 'post', '/api/comments/create/', {**COMMENT_BODY, 'post': '{post_id}'}),
+    Endpoint('drf:post-bulk', 'post', '/api/posts/bulk/', [POST_BODY] * 50),
+    Endpoint('drf:post-bulk-update', 'put', '/api/posts/bulk/', BULK_UPDATE_BODY),
+    Endpoint('drf:comment-bulk', 'post', '/api/comments/bulk/', [{**COMMENT_BODY, 'post_id': '{post_id}'}] * 50),
+    Endpoint('ninja:list-posts', 'get', '/api/ninja/posts'),
+    Endpoint('ninja:feed', 'get', '/api/ninja/feed'),
+    Endpoint('ninja:list-posts-sparse', 'get', '/api/ninja/posts?fields=id,title,excerpt,created_at'),
+    Endpoint('ninja:get-post', 'get', '/api/ninja/posts/{post_id}'),
+    Endpoint('ninja:list-post-comments', 'get', '/api/ninja/posts/{post_id}/comments'),
+    Endpoint('ninja:list-comments', 'get', '/api/ninja/comments'),
+    Endpoint('ninja:search', 'get', '/api/ninja/search?q=benchmark'),
+    Endpoint('ninja:export-posts', 'get', '/api/ninja/posts/export'),
+    Endpoint('ninja:export-comments', 'get', '/api/ninja/comments/export'),
+    Endpoint('ninja:create-post', 'post', '/api/ninja/posts', POST_BODY),
+    Endpoint('ninja:update-post', 'put', '/api/ninja/posts/{post_id}', POST_BODY),
+    Endpoint('ninja:create-comment', 'post', '/api/ninja/comments', {**COMMENT_BODY, 'post_id': '{post_id}'}),
+    Endpoint('ninja:bulk-posts', 'post', '/api/ninja/posts/bulk', [POST_BODY] * 50),
+    Endpoint('ninja:bulk-update-posts', 'put', '/api/ninja/posts/bulk', BULK_UPDATE_BODY),
+    Endpoint('ninja:bulk-comments', 'post', '/api/ninja/comments/bulk', [{**COMMENT_BODY, 'post_id': '{post_id}'}] * 50),
+    Endpoint('ninja:cache-stats', 'get', '/api/ninja/cache/stats'),
+    Endpoint('ninja-async:list-posts', 'get', '/api/ninja-async/posts'),
+    Endpoint('ninja-async:feed', 'get', '/api/ninja-async/feed'),
+    Endpoint('ninja-async:get-post', 'get', '/api/ninja-async/posts/{post_id}'),
+    Endpoint('ninja-async:list-post-comments', 'get', '/api/ninja-async/posts/{post_id}/comments'),
+    Endpoint('ninja-async:list-comments', 'get', '/api/ninja-async/comments'),
+    Endpoint('ninja-async:create-post', 'post', '/api/ninja-async/posts', POST_BODY),
+    Endpoint('ninja-async:update-post', 'put', '/api/ninja-async/posts/{post_id}', POST_BODY),
+    Endpoint('ninja-async:create-comment', 'post', '/api/ninja-async/comments',
+             {**COMMENT_BODY, 'post_id': '{post_id}'}),
+]
+
+
+def _fill(value, context):
+    if isinstance(value, str):
+        return value.format(**context)
+    if isinstance(value, list):
+        return [_fill(item, context) for item in value]
+    if isinstance(value, dict):
+        return {key: _fill(item, context) for key, item in value.items()}
+    return value
+
+
+def _call(client, endpoint, context):
+    path = _fill(endpoint.path, context)
+    kwargs = {}
+    if endpoint.body is not None:
+        kwargs = {'data': json.dumps(_fill(endpoint.body, context)), 'content_type': 'application/json'}
+    response = getattr(client, endpoint.method)(path, **kwargs)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response.status_code < 400
+
+
+def bench_endpoint(make_client, endpoint, context, iterations, concurrency):
+    """
+    Times `iterations` requests one after another, counting queries on the
+    first, then the same number again from `concurrency` threads at once.
+    """
+    client = make_client()
+    latencies, errors = [], 0
+    with CaptureQueriesContext(connection) as queries:
+        errors += not _call(client, endpoint, context)
+    query_count = len(queries)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        errors += not _call(client, endpoint, context)
+        latencies.append(time.perf_counter() - start)
+    sequential = summarize(latencies, time.perf_counter() - started, errors)
+
+    local, lock, errors = threading.local(), threading.Lock(), 0
+
+    def worker(_):
+        nonlocal errors
+        if not hasattr(local, 'client'):
+            local.client = make_client()
+        start = time.perf_counter()
+        ok = _call(local.client, endpoint, context)
+        elapsed = time.perf_counter() - start
+        if not ok:
+            with lock:
+                errors += 1
+        return elapsed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(worker, range(iterations)))
+    concurrent = summarize(latencies, time.perf_counter() - started, errors)
+    return {'queries': query_count, 'sequential': sequential, 'concurrent': concurrent}
+
+
+def regressions(current, baseline, threshold):
+    """Endpoints whose p95 grew by more than `threshold` times, or that now fail more often or run more queries."""
+    found = []
+    for name, result in current['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if before is None:
+            continue
+        for phase in ('sequential', 'concurrent'):
+            old, new = before[phase]['p95_ms'], result[phase]['p95_ms']
+            if old and new > old * threshold:
+                found.append(f'{name}: {phase} p95 {old} ms -> {new} ms')
+            # Failing fast must not pass for a speed-up.
+            old, new = before[phase].get('errors', 0), result[phase].get('errors', 0)
+            if new > old:
+                found.append(f'{name}: {phase} errors {old} -> {new}')
+        if result['queries'] > before['queries']:
+            found.append(f"{name}: queries {before['queries']} -> {result['queries']}")
+    return found
@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Comment, Post
+
+
+class BatchError(ValueError):
+    pass
+
+
+def check_batch(items):
+    if not isinstance(items, list):
+        raise BatchError('Expected a list of items.')
+    if not items:
+        raise BatchError('Expected at least one item.')
+    if len(items) > settings.BLOG_BULK_MAX_BATCH:
+        raise BatchError(f'A batch may hold at most {settings.BLOG_BULK_MAX_BATCH} items.')
+
+
+def item_error(index, errors):
+    return {'index': index, 'errors': errors}
+
+
+def bulk_result(created, errors):
+    """`(status, body)`: 201 if every item was written, 207 if only some were."""
+    body = {
+        'created': sorted(created, key=lambda item: item['index']),
+        'errors': sorted(errors, key=lambda item: item['index']),
+    }
+    return (207 if errors else 201), body
+
+
+# Each writer takes `[(index, validated_data), ...]` and returns `(created, errors)`,
+# writing every valid item in one transaction with a single bulk statement.
+def bulk_create_posts(valid):
+    with transaction.atomic():
+        posts = Post.objects.bulk_create([Post(**data) for _, data in valid])
+    return [{'index': index, 'id': post.id} for (index, _), post in zip(valid, posts)], []
+
+
+def unique_ids(valid):
+    """Splits off the items that repeat an id seen earlier in the batch, as errors."""
+    seen, unique, errors = set(), [], []
+    for index, data in valid:
+        if data['id'] in seen:
+            errors.append(item_error(index, {'id': ['Duplicate id in batch.']}))
+        else:
+            seen.add(data['id'])
+            unique.append((index, data))
+    return unique, errors
+
+
+def bulk_update_posts(valid):
+    valid, errors = unique_ids(valid)
+    updated, now = [], timezone.now()
+    with transaction.atomic():
+        # Locked until the update commits, so concurrent writes to these posts cannot be lost.
+        posts = Post.objects.select_for_update().in_bulk([data['id'] for _, data in valid])
+        for index, data in valid:
+            post = posts.get(data['id'])
+            if post is None:
+                errors.append(item_error(index, {'id': ['Post does not exist.']}))
+                continue
+            for attr, value in data.items():
+                if attr != 'id' and value is not None:
+                    setattr(post, attr, value)
+            post.updated_at = now  # bulk_update skips auto_now
+            updated.append((index, post))
+        Post.objects.bulk_update([post for _, post in updated], ['title', 'content', 'updated_at'])
+    return [{'index': index, 'id': post.id} for index, post in updated], errors
+
+
+def bulk_delete_posts(valid):
+    valid, errors = unique_ids(valid)
+    with transaction.atomic():
+        existing = set(Post.objects.select_for_update().filter(pk__in=[data['id'] for _, data in valid])
+                       .values_list('pk', flat=True))
+        Post.objects.filter(pk__in=existing).delete()
+    deleted = []
+    for index, data in valid:
+        if data['id'] in existing:
+            deleted.append({'index': index, 'id': data['id']})
+        else:
+            errors.append(item_error(index, {'id': ['Post does not exist.']}))
+    return deleted, errors
+
+
+def bulk_create_comments(valid):
+    # One query checks every referenced post instead of one FK lookup per item.
+    post_ids = {data['post_id'] for _, data in valid}
+    existing = set(Post.objects.filter(pk__in=post_ids).values_list('pk', flat=True))
+    errors = [item_error(index, {'post_id': ['Post does not exist.']})
+              for index, data in valid if data['post_id'] not in existing]
+    valid = [(index, data) for index, data in valid if data['post_id'] in existing]
+    comments = Comment.objects.bulk_create([Comment(**data) for _, data in valid])
+    return [{'index': index, 'id': comment.id} for (index, _), comment in zip(valid, comments)], errors
@@ -0,0 +1,150 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+MISSING = object()
+
+POST_VERSION_KEY = 'blog:post:{}:version'
+LIST_VERSION_KEY = 'blog:posts:version'
+STATS_KEY = 'blog:cache:{}'
+
+
+def get_cache():
+    return caches[settings.BLOG_CACHE_ALIAS]
+
+
+def _new_version():
+    # A fresh token rather than a counter: if a version key is evicted, readers
+    # pick a brand new version instead of resurrecting entries of an old one.
+    return time.time_ns()
+
+
+def _version(key):
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def _record(outcome):
+    cache = get_cache()
+    key = STATS_KEY.format(outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def cached(key, compute):
+    """Read-through: return the entry under `key`, computing and storing it on a miss."""
+    cache = get_cache()
+    value = cache.get(key, MISSING)
+    if value is not MISSING:
+        _record('hits')
+        return value
+    _record('misses')
+    from .routers import primary
+
+    # A lagging replica's rows would be served to every client, the writer included, until they expire.
+    with primary():
+        value = compute()
+    cache.set(key, value, settings.BLOG_CACHE_TIMEOUT)
+    return value
+
+
+def post_key(post_id, variant):
+    return f'blog:post:{post_id}:{_version(POST_VERSION_KEY.format(post_id))}:{variant}'
+
+
+def list_version():
+    return _version(LIST_VERSION_KEY)
+
+
+def list_key(variant, request=None):
+    key = f'blog:posts:{list_version()}:{variant}'
+    if request is not None:
+        key += ':' + hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return key
+
+
+def cached_post(post_id, variant, compute):
+    return cached(post_key(post_id, variant), compute)
+
+
+def invalidate_post(post_id=None):
+    """Drops the cached representations of one post and every cached list page."""
+    cache = get_cache()
+    if post_id is not None:
+        cache.set(POST_VERSION_KEY.format(post_id), _new_version(), None)
+    cache.set(LIST_VERSION_KEY, _new_version(), None)
+
+
+def invalidate_posts(post_ids):
+    cache = get_cache()
+    cache.set_many({POST_VERSION_KEY.format(post_id): _new_version() for post_id in post_ids}, None)
+    cache.set(LIST_VERSION_KEY, _new_version(), None)
+
+
+def cache_stats():
+    cache = get_cache()
+    hits = cache.get(STATS_KEY.format('hits'), 0)
+    misses = cache.get(STATS_KEY.format('misses'), 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': hits / total if total else 0.0}
+
+
+def is_first_page(request):
+    return not request.GET.get('cursor')
+
+
+# Django Rest Framework
+class CachedRetrieveMixin:
+    cache_variant = 'drf'
+
+    def get_cache_variant(self):
+        return self.cache_variant
+
+    def retrieve(self, request, *args, **kwargs):
+        data = cached_post(kwargs[self.lookup_field], self.get_cache_variant(),
+                           lambda: dict(self.get_serializer(self.get_object()).data))
+        return Response(data)
+
+
+class CachedListMixin:
+    """Caches the first page of a paginated list; deeper pages go to the database."""
+    cache_variant = 'drf'
+
+    def list(self, request, *args, **kwargs):
+        if not is_first_page(request):
+            return super().list(request, *args, **kwargs)
+
+        def compute():
+            data = super(CachedListMixin, self).list(request, *args, **kwargs).data
+            return {**data, 'results': [dict(item) for item in data['results']]}
+
+        return Response(cached(list_key(self.cache_variant, request), compute))
+
+
+# Django Ninja
+def cache_post_list(schema, variant='ninja'):
+    """Caches the first page produced by a `@paginate`d Ninja handler, already rendered through `schema`."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(request, **kwargs):
+            if not is_first_page(request):
+                return func(request, **kwargs)
+
+            def compute():
+                page = func(request, **kwargs)
+                return {**page, 'results': [schema.from_orm(item).dict(exclude_unset=True) for item in page['results']]}
+
+            return cached(list_key(variant, request), compute)
+        return wrapper
+    return decorator
@@ -0,0 +1,241 @@
+"""
+Response compression negotiated from Accept-Encoding: zstd, br or gzip, the
+first two only when their packages are installed.
+
+JSON and text of at least BLOG_COMPRESS_MIN_SIZE bytes are compressed;
+streams chunk by chunk. Event streams, HTML and already encoded responses are
+left alone. ETags become weak. With BLOG_COMPRESS_CACHE, bodies are cached
+per URL, type and ETag. `manage.py bench_compression` shows the level trade-off.
+"""
+import hashlib
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+
+from .cache import get_cache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSED_KEY = 'blog:compressed:{}:{}'
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'application/javascript',
+                      'application/xml', 'image/svg+xml', 'text/plain', 'text/csv', 'text/css')
+
+
+class Gzip:
+    name = 'gzip'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compressor(self):
+        # wbits=31 writes a gzip header with no timestamp, so equal bodies compress to equal bytes.
+        return _ZlibCompressor(zlib.compressobj(self.level, zlib.DEFLATED, 31))
+
+    def compress(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+
+class _ZlibCompressor:
+    def __init__(self, compressobj):
+        self._compressobj = compressobj
+
+    def chunk(self, data):
+        return self._compressobj.compress(data) + self._compressobj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressobj.flush()
+
+
+class Brotli:
+    name = 'br'
+
+    def __init__(self, quality=4):
+        self.quality = quality
+
+    def compressor(self):
+        return _BrotliCompressor(brotli.Compressor(mode=brotli.MODE_TEXT, quality=self.quality))
+
+    def compress(self, data):
+        return brotli.compress(data, mode=brotli.MODE_TEXT, quality=self.quality)
+
+
+class _BrotliCompressor:
+    def __init__(self, compressor):
+        self._compressor = compressor
+
+    def chunk(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class Zstd:
+    name = 'zstd'
+
+    def __init__(self, level=3):
+        self.level = level
+
+    def compressor(self):
+        return _ZstdCompressor(zstandard.ZstdCompressor(level=self.level).compressobj())
+
+    def compress(self, data):
+        # The content size in the frame header lets the client allocate the output once.
+        return zstandard.ZstdCompressor(level=self.level, write_content_size=True).compress(data)
+
+
+class _ZstdCompressor:
+    def __init__(self, compressobj):
+        self._compressobj = compressobj
+
+    def chunk(self, data):
+        return self._compressobj.compress(data) + self._compressobj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressobj.flush()
+
+
+def available_encoders():
+    """The encoders this process can use, best first."""
+    encoders = []
+    if zstandard is not None:
+        encoders.append(Zstd())
+    if brotli is not None:
+        encoders.append(Brotli())
+    encoders.append(Gzip())
+    return encoders
+
+
+ENCODERS = available_encoders()
+
+
+def accepted(accept_encoding):
+    """Accept-Encoding as {coding: q}."""
+    codings = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def negotiate(accept_encoding, encoders=None):
+    """The encoder to use for `accept_encoding`, or None to send the body as is."""
+    codings = accepted(accept_encoding)
+    best, best_q = None, 0.0
+    for encoder in ENCODERS if encoders is None else encoders:
+        q = codings.get(encoder.name, codings.get('*', 0.0))
+        # Ties go to the server's preference, which is the order of the encoders.
+        if q > best_q:
+            best, best_q = encoder, q
+    return best
+
+
+def compressible(response):
+    if response.has_header('Content-Encoding'):
+        return False
+    content_type = response.get('Content-Type', '').split(';', 1)[0].strip().lower()
+    return content_type in COMPRESSIBLE_TYPES or content_type.endswith('+json')
+
+
+def stream(encoder, chunks):
+    compressor = encoder.compressor()
+    for chunk in chunks:
+        data = compressor.chunk(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def astream(encoder, chunks):
+    compressor = encoder.compressor()
+    async for chunk in chunks:
+        data = compressor.chunk(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def cache_key(request, response, encoder):
+    if not settings.BLOG_COMPRESS_CACHE or request.method != 'GET' or not response.has_header('ETag'):
+        return None
+    variant = f"{request.get_full_path()}|{response['Content-Type']}|{response['ETag']}"
+    return COMPRESSED_KEY.format(encoder.name, hashlib.md5(variant.encode()).hexdigest())
+
+
+def compress_response(request, response):
+    """Compresses `response` in place when it is worth it and the client accepts an encoding."""
+    if not compressible(response):
+        return response
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoder = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if encoder is None:
+        return response
+
+    if response.streaming:
+        if response.is_async:
+            response.streaming_content = astream(encoder, response.streaming_content)
+        else:
+            response.streaming_content = stream(encoder, response.streaming_content)
+        del response['Content-Length']
+    else:
+        if len(response.content) < settings.BLOG_COMPRESS_MIN_SIZE:
+            return response
+        key = cache_key(request, response, encoder)
+        compressed = get_cache().get(key) if key is not None else None
+        if compressed is None:
+            compressed = encoder.compress(response.content)
+            if key is not None:
+                get_cache().set(key, compressed, settings.BLOG_CACHE_TIMEOUT)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+    response['Content-Encoding'] = encoder.name
+    return response
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.BLOG_COMPRESSION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return compress_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return compress_response(request, await self.get_response(request))
@@ -0,0 +1,92 @@
+from functools import wraps
+
+from django.db.models import Max
+from django.http import HttpResponseBase
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from .cache import cached, cached_post, list_key, list_version
+from .models import Post
+
+
+def _timestamp(value):
+    return int(value.timestamp() * 1_000_000) if value else 0
+
+
+# Only ETags are sent. A post changes with its comment count and the list with
+# deletes, neither of which moves updated_at, so a Last-Modified built from it
+# would answer If-Modified-Since with a stale 304.
+def post_validators(post_id, **kwargs):
+    """The ETag of one post, or None if it does not exist."""
+    return cached_post(post_id, 'etag', lambda: _probe_post(post_id))
+
+
+def post_list_validators(**kwargs):
+    """The ETag of the post list."""
+    return cached(list_key('etag'), _probe_post_list)
+
+
+def _probe_post(post_id):
+    row = Post.objects.filter(pk=post_id).values_list('updated_at', 'comment_count').first()
+    if row is None:
+        return None
+    updated_at, comment_count = row
+    return quote_etag(f'{post_id}.{_timestamp(updated_at)}.{comment_count}')
+
+
+def _probe_post_list():
+    # Max(updated_at)/Max(id) are index lookups; the list cache version also
+    # changes on deletes and comment counts.
+    probe = Post.objects.aggregate(last_modified=Max('updated_at'), last_id=Max('id'))
+    return quote_etag(f"{probe['last_id'] or 0}.{_timestamp(probe['last_modified'])}.{list_version()}")
+
+
+def not_modified(request, etag):
+    """Returns the 304/412 response for a matching conditional request, otherwise None."""
+    if etag is None or request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        set_etag(response, etag)
+    return response
+
+
+def set_etag(response, etag):
+    if etag is not None:
+        response['ETag'] = etag
+    return response
+
+
+# Django Rest Framework
+class ConditionalRetrieveMixin:
+    def retrieve(self, request, *args, **kwargs):
+        etag = post_validators(kwargs[self.lookup_field])
+        return not_modified(request, etag) or set_etag(super().retrieve(request, *args, **kwargs), etag)
+
+
+class ConditionalListMixin:
+    def list(self, request, *args, **kwargs):
+        etag = post_list_validators()
+        return not_modified(request, etag) or set_etag(super().list(request, *args, **kwargs), etag)
+
+
+# Django Ninja
+def conditional(validators):
+    """
+    Answers conditional GETs from `validators(**kwargs)` before the handler runs.
+    The handler must accept a `response: HttpResponse` argument, which receives
+    the ETag header.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(request, **kwargs):
+            etag = validators(**kwargs)
+            response = not_modified(request, etag)
+            if response is not None:
+                return response
+            result = func(request, **kwargs)
+            # A handler may answer with its own HttpResponse, which Ninja sends as is.
+            set_etag(result if isinstance(result, HttpResponseBase) else kwargs['response'], etag)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,110 @@
+import heapq
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+POST_EXPORT_FIELDS = ('id', 'title', 'content', 'created_at', 'updated_at')
+COMMENT_EXPORT_FIELDS = ('id', 'post_id', 'text', 'email')
+
+# Rows are joined into blocks of roughly this many bytes before being handed to
+# the server, so a 10M row dump is not written as 10M tiny chunks.
+BUFFER_SIZE = 64 * 1024
+
+
+class _Blocks:
+    """Encodes rows and joins them into blocks of about BUFFER_SIZE bytes."""
+
+    def __init__(self, output):
+        self.encode = DjangoJSONEncoder(separators=(',', ':')).encode
+        self.ndjson = output == 'ndjson'
+        self.count = 0
+        self.buffer = [] if self.ndjson else ['[']
+        self.size = len(self.buffer)
+
+    def add(self, row):
+        """The next block once enough rows are buffered, otherwise None."""
+        if self.ndjson:
+            line = self.encode(row) + '\n'
+        else:
+            line = (',' if self.count else '') + self.encode(row)
+        self.count += 1
+        self.buffer.append(line)
+        self.size += len(line)
+        if self.size < BUFFER_SIZE:
+            return None
+        block, self.buffer, self.size = ''.join(self.buffer), [], 0
+        return block
+
+    def close(self):
+        return ''.join(self.buffer) + ('' if self.ndjson else ']')
+
+
+def _rows(queryset, fields):
+    return queryset.order_by('pk').values(*fields)
+
+
+async def _amerge(iterators, key):
+    """`heapq.merge` for async iterators."""
+    heads = []
+    for iterator in iterators:
+        async for item in iterator:
+            heads.append([item, iterator])
+            break
+    while heads:
+        head = min(heads, key=lambda head: key(head[0]))
+        yield head[0]
+        try:
+            head[0] = await anext(head[1])
+        except StopAsyncIteration:
+            heads.remove(head)
+
+
+def iter_rows(queryset, fields, output='ndjson', chunk_size=None):
+    """
+    Encodes `queryset` row by row. `.values().iterator()` uses a server-side
+    cursor on Postgres, so neither model instances nor the full result set are
+    ever held in memory. `queryset` can also be a list of querysets with
+    disjoint ids, such as recent and archived comments, merged in id order.
+    """
+    chunk_size = chunk_size or settings.BLOG_EXPORT_CHUNK_SIZE
+    querysets = queryset if isinstance(queryset, list) else [queryset]
+    rows = heapq.merge(*(_rows(qs, fields).iterator(chunk_size=chunk_size) for qs in querysets), key=itemgetter('id'))
+    blocks = _Blocks(output)
+    for row in rows:
+        block = blocks.add(row)
+        if block is not None:
+            yield block
+    yield blocks.close()
+
+
+async def aiter_rows(queryset, fields, output='ndjson', chunk_size=None):
+    """
+    `iter_rows` for ASGI. Django buffers a sync iterator whole before sending
+    it to an ASGI server, so this one reads the rows a chunk at a time instead.
+    """
+    chunk_size = chunk_size or settings.BLOG_EXPORT_CHUNK_SIZE
+    querysets = queryset if isinstance(queryset, list) else [queryset]
+    rows = _amerge([_rows(qs, fields).aiterator(chunk_size=chunk_size) for qs in querysets], itemgetter('id'))
+    blocks = _Blocks(output)
+    async for row in rows:
+        block = blocks.add(row)
+        if block is not None:
+            yield block
+    yield blocks.close()
+
+
+def export_response(request, queryset, fields, output='ndjson', filename=None):
+    rows = aiter_rows if isinstance(request, ASGIRequest) else iter_rows
+    response = StreamingHttpResponse(rows(queryset, fields, output), content_type=EXPORT_FORMATS[output])
+    if filename:
+        extension = 'ndjson' if output == 'ndjson' else 'json'
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    return response
@@ -0,0 +1,85 @@
+"""
+The feed: the latest posts with their excerpt and comment count.
+
+Each post has a FeedEntry holding its summary already rendered to JSON. The
+signal receivers in signals.py refresh the entries of the posts that change,
+in the same transaction as the change: post saves (API, admin, shell), the
+comment_count updates behind every comment create and delete, and bulk
+creates and updates. Deleting a post cascades to its entry. Writes that
+bypass the ORM (seed_db's COPY) rebuild the feed, as `manage.py rebuild_feed`
+does.
+
+A feed page is then one index range scan of FeedEntry, and the response is
+the stored bodies joined together: nothing is serialized per post.
+"""
+from django.db import router, transaction
+
+from .models import FeedEntry, Post
+from .pagination import Keyset, get_limit, next_link
+from .renderers import dumps
+from .serializers import PostSerializer
+
+FEED_FIELDS = ('id', 'title', 'excerpt', 'comment_count', 'created_at')
+FEED_KEYSET = Keyset('-created_at', '-post')
+
+
+def render(post):
+    # Exactly what the post list gives for ?fields=<FEED_FIELDS>.
+    return dumps(PostSerializer(post, fields=FEED_FIELDS).data).decode()
+
+
+def entries(posts):
+    return [FeedEntry(post_id=post.pk, created_at=post.created_at, body=render(post)) for post in posts]
+
+
+def save(entries, using):
+    FeedEntry.objects.using(using).bulk_create(
+        entries, update_conflicts=True, unique_fields=['post'], update_fields=['created_at', 'body'])
+
+
+def refresh(post_ids):
+    """Re-renders the entries of `post_ids`, from the primary so replica lag cannot leak in."""
+    using = router.db_for_write(FeedEntry)
+    posts = list(Post.objects.using(using).filter(pk__in=post_ids).only(*FEED_FIELDS))
+    if posts:
+        save(entries(posts), using)
+    missing = set(post_ids) - {post.pk for post in posts}
+    if missing:
+        FeedEntry.objects.using(using).filter(post_id__in=missing).delete()
+
+
+def rebuild(batch_size=1000):
+    """Replaces every entry with one rendered from the posts table; returns the number of posts."""
+    using = router.db_for_write(FeedEntry)
+    total = 0
+    with transaction.atomic(using=using):
+        FeedEntry.objects.using(using).all().delete()
+        batch = []
+        for post in Post.objects.using(using).only(*FEED_FIELDS).iterator(chunk_size=batch_size):
+            batch.append(post)
+            if len(batch) == batch_size:
+                FeedEntry.objects.using(using).bulk_create(entries(batch))
+                total += len(batch)
+                batch = []
+        FeedEntry.objects.using(using).bulk_create(entries(batch))
+    return total + len(batch)
+
+
+def page_queryset():
+    return FeedEntry.objects.values_list('created_at', 'post', 'body', named=True)
+
+
+def render_page(request, rows, cursor):
+    body = b','.join(row.body.encode() for row in rows)
+    return b'{"next":%s,"results":[%s]}' % (dumps(next_link(request, cursor)), body)
+
+
+def feed_page(request, cursor=None, limit=None):
+    """The feed page after `cursor` as a rendered JSON document. Raises InvalidCursor."""
+    rows, next_cursor = FEED_KEYSET.paginate(page_queryset(), cursor, get_limit(limit))
+    return render_page(request, rows, next_cursor)
+
+
+async def afeed_page(request, cursor=None, limit=None):
+    rows, next_cursor = await FEED_KEYSET.apaginate(page_queryset(), cursor, get_limit(limit))
+    return render_page(request, rows, next_cursor)
@@ -0,0 +1,139 @@
+"""
+Sparse fieldsets: `?fields=id,title,excerpt` returns just those fields of each
+post. The selection is pushed down into the query, so the columns left out
+(the post content above all) are neither read from the database nor serialized.
+
+With `raw`, a post list skips models and serializers altogether: rows come
+straight from `.values_list()` and go out as one array per post.
+"""
+from functools import wraps
+
+from django.http import HttpResponse
+from ninja.errors import HttpError
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+
+from .pagination import POST_KEYSET, InvalidCursor, get_limit, next_link
+from .renderers import dumps
+
+POST_FIELDS = ('id', 'title', 'excerpt', 'content', 'comment_count', 'created_at', 'updated_at')
+
+
+def parse_fields(value, allowed=POST_FIELDS):
+    """`'title,id'` → `('id', 'title')`, in `allowed` order; None when no selection was asked for."""
+    names = {name.strip() for name in (value or '').split(',')} - {''}
+    if not names:
+        return None
+    unknown = names - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}. Choose from: {', '.join(allowed)}.")
+    return tuple(name for name in allowed if name in names)
+
+
+def columns(fields):
+    """The selected fields plus those the post keyset needs to build the next cursor."""
+    return tuple(dict.fromkeys([*(fields or POST_FIELDS), *POST_KEYSET.fields]))
+
+
+def raw_page(queryset, request, fields, cursor=None, limit=None):
+    """
+    A page as `{next, fields, results}`, where each result is the row of one post
+    with its values in `fields` order. Raises InvalidCursor.
+    """
+    fields = fields or POST_FIELDS
+    rows, next_cursor = POST_KEYSET.paginate(
+        queryset.values_list(*columns(fields), named=True), cursor, get_limit(limit))
+    return {
+        'next': next_link(request, next_cursor),
+        'fields': fields,
+        'results': [row[:len(fields)] for row in rows],
+    }
+
+
+# Django Rest Framework
+class SparseFieldsMixin:
+    """`?fields=` on GET requests: serializes only those fields, and loads only their columns."""
+
+    def requested_fields(self):
+        if self.request.method != 'GET':
+            return None
+        try:
+            return parse_fields(self.request.query_params.get('fields'))
+        except ValueError as exc:
+            raise ValidationError({'fields': [str(exc)]})
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method != 'GET':
+            return queryset
+        return queryset.only(*columns(self.requested_fields()))
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.requested_fields()
+        if fields is not None:
+            kwargs['fields'] = fields
+        return super().get_serializer(*args, **kwargs)
+
+    def get_cache_variant(self):
+        fields = self.requested_fields()
+        variant = super().get_cache_variant()
+        return variant if fields is None else f"{variant}:{','.join(fields)}"
+
+
+class RawListMixin:
+    """`?raw=1` on a post list: a `raw_page` instead of the serializer. Needs SparseFieldsMixin."""
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('raw') not in ('1', 'true'):
+            return super().list(request, *args, **kwargs)
+        try:
+            page = raw_page(self.filter_queryset(self.get_queryset()), request, self.requested_fields(),
+                            request.query_params.get('cursor'), request.query_params.get('limit'))
+        except InvalidCursor:
+            raise NotFound('Invalid cursor')
+        return Response(page)
+
+
+# Django Ninja
+def ninja_fields(value):
+    """`parse_fields` for Ninja handlers, failing with a 400."""
+    try:
+        return parse_fields(value)
+    except ValueError as exc:
+        raise HttpError(400, str(exc))
+
+
+def select_fields(page, fields):
+    """Drops the cursor columns a page of `.values(*columns(fields))` rows carries but was not asked for."""
+    if fields is None:
+        return page
+    return {**page, 'results': [{name: row[name] for name in fields} for row in page['results']]}
+
+
+def sparse_post_list(func):
+    """For a `@paginate`d handler returning `.values(*columns(fields))`; goes right above `@paginate`."""
+    @wraps(func)
+    def wrapper(request, **kwargs):
+        return select_fields(func(request, **kwargs), ninja_fields(kwargs.get('fields')))
+    return wrapper
+
+
+def raw_post_list(queryset):
+    """
+    `?raw=true` on a `@paginate`d post list: a `raw_page` of `queryset`, rendered
+    with orjson straight into the response. Goes above the caching decorators.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(request, **kwargs):
+            if not kwargs.get('raw'):
+                return func(request, **kwargs)
+            pagination = kwargs['ninja_pagination']
+            try:
+                page = raw_page(queryset.all(), request, ninja_fields(kwargs.get('fields')),
+                                pagination.cursor, pagination.limit)
+            except InvalidCursor:
+                raise HttpError(404, 'Invalid cursor')
+            return HttpResponse(dumps(page), content_type='application/json')
+        return wrapper
+    return decorator
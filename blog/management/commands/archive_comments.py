@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.archive import archive, cutoff
+
+
+class Command(BaseCommand):
+    help = 'Moves comments older than BLOG_COMMENT_ARCHIVE_DAYS to the comment archive, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Archive comments older than this (default BLOG_COMMENT_ARCHIVE_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Comments moved per transaction')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        before = cutoff(options['days'])
+        total = 0
+        for moved in archive(before, options['batch_size']):
+            total += moved
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{total} comments archived')
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} comments created before {before:%Y-%m-%d %H:%M}'))
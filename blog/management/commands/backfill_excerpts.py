@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.models import Post, make_excerpt
+
+
+class Command(BaseCommand):
+    help = 'Fills Post.excerpt for posts written before the column existed, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Posts updated per statement')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        total, last_id = 0, 0
+        while True:
+            # Keyset by id reads only the posts still missing one, a batch at a time.
+            posts = list(Post.objects.filter(excerpt='', pk__gt=last_id).exclude(content='')
+                         .order_by('pk').only('id', 'content')[:options['batch_size']])
+            if not posts:
+                break
+            for post in posts:
+                post.excerpt = make_excerpt(post.content)
+            Post.objects.bulk_update(posts, ['excerpt'])
+            total += len(posts)
+            last_id = posts[-1].pk
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{total} excerpts filled')
+        self.stdout.write(self.style.SUCCESS(f'Filled {total} excerpts'))
@@ -0,0 +1,106 @@
+import json
+import logging
+import platform
+import re
+from urllib.parse import parse_qs, urlparse
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from blog.bench import ENDPOINTS, bench_endpoint, regressions, scratch_database
+from blog.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks every API endpoint in-process against a scratch database and reports latency, throughput and queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=200)
+        parser.add_argument('--comments-per-post', type=int, default=5)
+        parser.add_argument('--iterations', type=int, default=50, help='Requests per endpoint and phase')
+        parser.add_argument('--concurrency', type=int, default=8, help='Threads in the concurrent phase')
+        parser.add_argument('--only', help='Regex; benchmark only endpoints whose name matches')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--baseline', help='Results JSON of an earlier run to compare against')
+        parser.add_argument('--threshold', type=float, default=1.5,
+                            help='Fail when an endpoint p95 exceeds baseline p95 times this factor')
+
+    def handle(self, *args, **options):
+        endpoints = ENDPOINTS
+        if options['only']:
+            endpoints = [endpoint for endpoint in endpoints if re.search(options['only'], endpoint.name)]
+
+        # Failed requests are counted per endpoint; their tracebacks would drown the report.
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        with scratch_database():
+            self.seed(options['posts'], options['comments_per_post'])
+            make_client = self.client_factory()
+            context = self.context(make_client())
+            results = {}
+            for endpoint in endpoints:
+                results[endpoint.name] = bench_endpoint(
+                    make_client, endpoint, context, options['iterations'], options['concurrency'])
+                self.report(endpoint.name, results[endpoint.name])
+            vendor = connection.vendor
+
+        run = {
+            'meta': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': vendor,
+                **{key: options[key] for key in ('posts', 'comments_per_post', 'iterations', 'concurrency')},
+            },
+            'endpoints': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(run, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                found = regressions(run, json.load(f), options['threshold'])
+            if found:
+                raise CommandError('Regressions against baseline:\n  ' + '\n  '.join(found))
+            self.stdout.write(self.style.SUCCESS('No regressions against baseline.'))
+
+    def seed(self, posts, comments_per_post):
+        created = Post.objects.bulk_create(
+            [Post(title=f'Benchmark post {i}', content='Benchmark content ' * 20) for i in range(posts)])
+        Comment.objects.bulk_create(
+            [Comment(post=post, text=f'Comment {i}', email='bench@example.com')
+             for post in created for i in range(comments_per_post)])
+
+    def client_factory(self):
+        user = User.objects.create_user(username='bench', password='bench')
+        token = Token.objects.create(user=user)
+        session = Client()
+        session.force_login(user)
+
+        def make_client():
+            # Token auth for the DRF views, the session cookie for Ninja's login_required.
+            client = Client(raise_request_exception=False, HTTP_AUTHORIZATION=f'Token {token.key}')
+            client.cookies = session.cookies
+            return client
+        return make_client
+
+    def context(self, client):
+        post_ids = list(Post.objects.order_by('id').values_list('id', flat=True)[:50])
+        next_page = client.get('/api/posts/').json()['next']
+        cursor = parse_qs(urlparse(next_page).query)['cursor'][0] if next_page else ''
+        return {'post_id': post_ids[0], 'cursor': cursor,
+                **{f'post_id_{i}': post_ids[i % len(post_ids)] for i in range(50)}}
+
+    def report(self, name, result):
+        line = f'{name:<34} q={result["queries"]:<3}'
+        for phase in ('sequential', 'concurrent'):
+            summary = result[phase]
+            line += (f'  {phase[:3]} p50 {summary["p50_ms"]:>7} p95 {summary["p95_ms"]:>7} '
+                     f'p99 {summary["p99_ms"]:>7} ms {summary["rps"]:>7} rps')
+            if summary['errors']:
+                line += f' ({summary["errors"]} errors)'
+        self.stdout.write(line)
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client
+
+from blog.bench import scratch_database, summarize
+from blog.models import Comment, Post
+
+PATHS = ['/posts?limit=20', '/posts/{post_id}', '/posts/{post_id}/comments?limit=20']
+
+
+class Command(BaseCommand):
+    help = 'Compares the async Ninja API (ASGI) with the sync one (WSGI thread pool) under concurrent load'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per mode')
+        parser.add_argument('--concurrency', type=int, default=200, help='Requests in flight at once')
+        parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads')
+        parser.add_argument('--posts', type=int, default=100)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            post_id = self.seed(options['posts'])
+            user = User.objects.create_user(username='bench', password='bench')
+            client = Client()
+            client.force_login(user)
+            cookies = client.cookies
+            urls = [path.format(post_id=post_id) for path in PATHS]
+            results = [
+                self.run_sync(cookies, urls, options['requests'], options['threads']),
+                asyncio.run(self.run_async(cookies, urls, options['requests'], options['concurrency'])),
+            ]
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            self.stdout.write(
+                f"{result['mode']:<6} {result['requests']:>6} req  {result['rps']:>9} req/s  "
+                f"p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms  "
+                f"p99 {result['p99_ms']:>8} ms  errors {result['errors']}  peak threads {result['peak_threads']}"
+            )
+
+    def seed(self, count):
+        posts = Post.objects.bulk_create([Post(title=f'Post {i}', content='x' * 500) for i in range(count)])
+        Comment.objects.bulk_create([Comment(post=posts[0], text=f'Comment {i}', email='a@example.com')
+                                     for i in range(50)])
+        return posts[0].id
+
+    def run_sync(self, cookies, urls, total, threads):
+        local = threading.local()
+        peak, errors = threading.active_count(), 0
+
+        def call(i):
+            nonlocal peak, errors
+            if not hasattr(local, 'client'):
+                local.client = Client()
+                local.client.cookies = cookies
+            start = time.perf_counter()
+            response = local.client.get('/api/ninja' + urls[i % len(urls)])
+            elapsed = time.perf_counter() - start
+            peak = max(peak, threading.active_count())
+            errors += response.status_code != 200
+            return elapsed
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            latencies = list(pool.map(call, range(total)))
+        elapsed = time.perf_counter() - started
+        connection.close()
+        return {'mode': 'wsgi', **summarize(latencies, elapsed, errors), 'peak_threads': peak}
+
+    async def run_async(self, cookies, urls, total, concurrency):
+        client = AsyncClient()
+        client.cookies = cookies
+        limit = asyncio.Semaphore(concurrency)
+        peak, errors = threading.active_count(), 0
+
+        async def call(i):
+            nonlocal peak, errors
+            async with limit:
+                start = time.perf_counter()
+                response = await client.get('/api/ninja-async' + urls[i % len(urls)])
+                elapsed = time.perf_counter() - start
+                peak = max(peak, threading.active_count())
+                errors += response.status_code != 200
+                return elapsed
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(call(i) for i in range(total)))
+        elapsed = time.perf_counter() - started
+        return {'mode': 'asgi', **summarize(latencies, elapsed, errors), 'peak_threads': peak}
@@ -0,0 +1,73 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from faker import Faker
+
+from blog.bench import scratch_database
+from blog.compression import ENCODERS, Brotli, Gzip, Zstd
+from blog.models import Post
+from blog.pagination import POST_KEYSET, get_limit
+from blog.renderers import dumps
+from blog.serializers import PostSerializer
+
+LEVELS = {'gzip': (1, 6, 9), 'br': (1, 4, 6, 11), 'zstd': (1, 3, 9, 19)}
+ENCODER_CLASSES = {'gzip': Gzip, 'br': Brotli, 'zstd': Zstd}
+
+
+class Command(BaseCommand):
+    help = ('Measures bytes on the wire and compression CPU time per response for a page of posts, '
+            'for every encoding and a range of levels')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100, help='Posts per page, at most BLOG_MAX_PAGE_SIZE')
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        size = get_limit(options['page_size'])
+        fake = Faker()
+        fake.seed_instance(options['seed'])
+        with scratch_database():
+            Post.objects.bulk_create([Post(title=fake.sentence(nb_words=6), content='\n\n'.join(fake.paragraphs(5)))
+                                      for _ in range(size)])
+            body = dumps(PostSerializer(Post.objects.order_by(*POST_KEYSET.ordering)[:size], many=True).data)
+
+        defaults = {encoder.name: encoder for encoder in ENCODERS}
+        results = [{'encoding': 'identity', 'level': None, 'bytes': len(body), 'ratio': 1.0, 'cpu_ms': 0.0}]
+        for name, levels in LEVELS.items():
+            if name not in defaults:
+                self.stderr.write(f'{name} is not available, install its package to include it')
+                continue
+            default = getattr(defaults[name], 'quality', getattr(defaults[name], 'level', None))
+            for level in levels:
+                result = self.run(ENCODER_CLASSES[name](level), body, options['iterations'])
+                result['default'] = level == default
+                results.append(result)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            level = '' if result['level'] is None else result['level']
+            marker = '  (served)' if result.get('default') else ''
+            self.stdout.write(
+                f"{result['encoding']:<9} {level:>3}  {result['bytes']:>8} B  x{result['ratio']:<6}  "
+                f"cpu {result['cpu_ms']:>8} ms/response{marker}"
+            )
+
+    def run(self, encoder, body, iterations):
+        compressed = encoder.compress(body)
+        # CPU time rather than wall time: what a worker spends per response.
+        started = time.process_time()
+        for _ in range(iterations):
+            encoder.compress(body)
+        cpu = (time.process_time() - started) / iterations
+        return {
+            'encoding': encoder.name,
+            'level': getattr(encoder, 'quality', getattr(encoder, 'level', None)),
+            'bytes': len(compressed),
+            'ratio': round(len(body) / len(compressed), 2),
+            'cpu_ms': round(cpu * 1000, 3),
+        }
@@ -0,0 +1,86 @@
+import copy
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.utils import load_backend
+
+from blog.bench import summarize
+from blog.pool import get_pool
+
+
+class Command(BaseCommand):
+    help = ('Times connect, SELECT 1, close cycles (what every request does with CONN_MAX_AGE=0) '
+            'with direct connections against the pooled backend')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=500, help='Cycles per thread')
+        parser.add_argument('--threads', type=int, default=1)
+        parser.add_argument('--pool-size', type=int, default=4)
+        parser.add_argument('--sqlite', action='store_true',
+                            help='Use a scratch SQLite file instead of the default database')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        settings_dict = copy.deepcopy(connections['default'].settings_dict)
+        scratch = None
+        if options['sqlite']:
+            handle, scratch = tempfile.mkstemp(suffix='.sqlite3', prefix='bench_connect_')
+            os.close(handle)
+            settings_dict.update(ENGINE='django.db.backends.sqlite3', NAME=scratch)
+        vendor = settings_dict['ENGINE'].rsplit('.', 1)[-1]
+        modes = {
+            'direct': {**settings_dict, 'ENGINE': f'django.db.backends.{vendor}'},
+            'pooled': {**settings_dict, 'ENGINE': f'blog.backends.{vendor}',
+                       'POOL': {'SIZE': options['pool_size'], 'TIMEOUT': 30.0}},
+        }
+        try:
+            results = [self.run(name, mode, options['iterations'], options['threads'])
+                       for name, mode in modes.items()]
+        finally:
+            if scratch:
+                os.remove(scratch)
+
+        baseline = results[0]['mean_ms']
+        for result in results:
+            result['speedup'] = round(baseline / result['mean_ms'], 2) if result['mean_ms'] else 0.0
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            self.stdout.write(
+                f"{result['mode']:<8} mean {result['mean_ms']:>8} ms  p95 {result['p95_ms']:>8} ms  "
+                f"{result['rps']:>9} cycles/s  x{result['speedup']}  "
+                f"connects {result['connects']}  waits {result['waits']}  timeouts {result['timeouts']}"
+            )
+
+    def run(self, name, settings_dict, iterations, threads):
+        alias = f'bench_connect_{name}'
+        backend = load_backend(settings_dict['ENGINE'])
+
+        def worker(_):
+            wrapper = backend.DatabaseWrapper(settings_dict, alias)
+            latencies = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                wrapper.close()
+                latencies.append(time.perf_counter() - start)
+            return latencies
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as executor:
+            latencies = [latency for chunk in executor.map(worker, range(threads)) for latency in chunk]
+        summary = summarize(latencies, time.perf_counter() - started)
+
+        stats = {'connects': len(latencies), 'waits': 0, 'timeouts': 0}
+        if 'POOL' in settings_dict:
+            pool = get_pool(alias, settings_dict['POOL']['SIZE'], settings_dict['POOL']['TIMEOUT'])
+            stats = {key: pool.stats()[key] for key in stats}
+            pool.close_idle()
+        return {'mode': name, **summary, **stats}
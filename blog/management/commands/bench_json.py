@@ -0,0 +1,64 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from blog.bench import scratch_database, summarize
+from blog.fieldsets import raw_page
+from blog.models import Post
+from blog.pagination import POST_KEYSET, get_limit
+from blog.renderers import ORJSONRenderer, dumps
+from blog.serializers import PostSerializer
+
+
+class Command(BaseCommand):
+    help = ('Times serializing a page of posts with PostSerializer(many=True) against orjson '
+            'and the raw values_list() list mode')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100, help='Posts per page, at most BLOG_MAX_PAGE_SIZE')
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        size = get_limit(options['page_size'])
+        with scratch_database():
+            Post.objects.bulk_create([Post(title=f'Post {i}', content='Lorem ipsum dolor sit amet. ' * 40)
+                                      for i in range(size)])
+            request = RequestFactory().get('/api/posts/')
+
+            def page():
+                return Post.objects.order_by(*POST_KEYSET.ordering)[:size]
+
+            cases = {
+                'serializer+json': lambda: JSONRenderer().render(PostSerializer(page(), many=True).data),
+                'serializer+orjson': lambda: ORJSONRenderer().render(PostSerializer(page(), many=True).data),
+                'raw+json': lambda: JSONRenderer().render(raw_page(Post.objects.all(), request, None, limit=size)),
+                'raw+orjson': lambda: dumps(raw_page(Post.objects.all(), request, None, limit=size)),
+            }
+            results = [self.run(name, case, options['iterations']) for name, case in cases.items()]
+
+        baseline = results[0]['mean_ms']
+        for result in results:
+            result['speedup'] = round(baseline / result['mean_ms'], 2) if result['mean_ms'] else 0.0
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            self.stdout.write(
+                f"{result['mode']:<18} {result['bytes']:>8} B  mean {result['mean_ms']:>8} ms  "
+                f"p95 {result['p95_ms']:>8} ms  x{result['speedup']}"
+            )
+
+    def run(self, name, case, iterations):
+        body = case()
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            start = time.perf_counter()
+            case()
+            latencies.append(time.perf_counter() - start)
+        summary = summarize(latencies, time.perf_counter() - started)
+        return {'mode': name, 'bytes': len(body), **summary}
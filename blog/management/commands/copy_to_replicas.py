@@ -0,0 +1,29 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ('Copies the default SQLite database over the SQLite read replicas in DB_REPLICA_URLS, '
+            'standing in for replication when trying the replica router locally')
+
+    def handle(self, *args, **options):
+        if not settings.BLOG_READ_REPLICAS:
+            raise CommandError('No read replicas configured, set DB_REPLICA_URLS.')
+        aliases = [DEFAULT_DB_ALIAS, *settings.BLOG_READ_REPLICAS]
+        if any(connections[alias].vendor != 'sqlite' for alias in aliases):
+            raise CommandError('Only SQLite primaries and replicas can be copied; replicate other databases natively.')
+
+        source = sqlite3.connect(connections[DEFAULT_DB_ALIAS].settings_dict['NAME'])
+        try:
+            for alias in settings.BLOG_READ_REPLICAS:
+                target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f'Copied {DEFAULT_DB_ALIAS} to {alias}')
+        finally:
+            source.close()
@@ -0,0 +1,29 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from blog.writebehind import drain
+
+
+class Command(BaseCommand):
+    help = 'Writes the comments queued by the write-behind endpoints to the database, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Comments per bulk insert')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--consumer', default='default',
+                            help='Name of this flusher; give each one its own when running several')
+        parser.add_argument('--once', action='store_true', help='Flush what is queued now, then exit')
+
+    def handle(self, *args, **options):
+        stopping = options['once']
+
+        def stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+
+        # SIGTERM (docker stop) and Ctrl-C end the loop, then whatever is already queued is flushed.
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        total = drain(options['batch_size'], options['consumer'], lambda: stopping, options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Flushed {total} queued comments'))
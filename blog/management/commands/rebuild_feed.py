@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from blog import feed
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the materialized post feed from the posts table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Posts rendered per insert')
+
+    def handle(self, *args, **options):
+        total = feed.rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the feed: {total} posts'))
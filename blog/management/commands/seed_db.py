@@ -1,13 +1,120 @@
-from django.core.management.base import BaseCommand
-from blog.factories import PostFactory, CommentFactory
+import csv
+import io
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from faker import Faker
+
+from blog import feed
+from blog.models import Comment, Post, make_excerpt
+from blog.signals import posts_changed
+
+
+def generate_batch(spec):
+    """
+    Fake rows for one batch: `[(title, content, [(text, email), ...]), ...]`.
+    Each batch has its own Faker seed, so the data only depends on --seed and
+    --batch-size, never on how many workers generated it.
+    """
+    index, size, comments_per_post, seed = spec
+    fake = Faker()
+    fake.seed_instance(f'{seed}-{index}')
+    return [
+        (fake.sentence(nb_words=6), fake.paragraph(),
+         [(fake.paragraph(), fake.email()) for _ in range(comments_per_post)])
+        for _ in range(size)
+    ]
+
+
+def insert_bulk(batch):
+    posts = Post.objects.bulk_create(
+        [Post(title=title, content=content, comment_count=len(comments)) for title, content, comments in batch])
+    Comment.objects.bulk_create(
+        [Comment(post_id=post.id, text=text, email=email)
+         for post, (_, _, comments) in zip(posts, batch) for text, email in comments],
+        update_counts=False,
+    )
+
+
+def _csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    return buffer
+
+
+def insert_copy(batch):
+    """PostgreSQL COPY, with post ids reserved from the sequence up front so comments can reference them."""
+    now = timezone.now().isoformat()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval(pg_get_serial_sequence('blog_post', 'id')) FROM generate_series(1, %s)",
+                       [len(batch)])
+        ids = [row[0] for row in cursor.fetchall()]
+        cursor.copy_expert(
+            'COPY blog_post (id, title, content, excerpt, comment_count, created_at, updated_at) '
+            'FROM STDIN WITH (FORMAT csv)',
+            _csv((post_id, title, content, make_excerpt(content), len(comments), now, now)
+                 for post_id, (title, content, comments) in zip(ids, batch)))
+        cursor.copy_expert(
+            'COPY blog_comment (post_id, text, email, created_at) FROM STDIN WITH (FORMAT csv)',
+            _csv((post_id, text, email, now)
+                 for post_id, (_, _, comments) in zip(ids, batch) for text, email in comments))
+
 
 class Command(BaseCommand):
-    help = 'Seeds the database with initial data'
-
-    def handle(self, *args, **kwargs):
-        # Create 10 posts and 5 comments for each post
-        for _ in range(10):
-            post = PostFactory()
-            for _ in range(5):
-                CommentFactory(post=post)
-        self.stdout.write(self.style.SUCCESS('Database successfully seeded!'))
+    help = 'Seeds the database with fake posts and comments, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=10)
+        parser.add_argument('--comments-per-post', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=1000, help='Posts generated and inserted per batch')
+        parser.add_argument('--workers', type=int, default=1, help='Processes generating fake data')
+        parser.add_argument('--seed', type=int, default=0, help='Same seed and batch size, same data')
+        parser.add_argument('--method', choices=['auto', 'bulk', 'copy'], default='auto',
+                            help='bulk_create, or PostgreSQL COPY (the default on PostgreSQL)')
+
+    def handle(self, *args, **options):
+        posts, per_post, batch_size = options['posts'], options['comments_per_post'], options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+        self.verbosity = options['verbosity']
+        method = options['method']
+        if method == 'auto':
+            method = 'copy' if connection.vendor == 'postgresql' else 'bulk'
+        if method == 'copy' and connection.vendor != 'postgresql':
+            raise CommandError('--method copy needs PostgreSQL')
+        insert = insert_copy if method == 'copy' else insert_bulk
+
+        specs = [(index, min(batch_size, posts - start), per_post, options['seed'])
+                 for index, start in enumerate(range(0, posts, batch_size))]
+        started, done = time.perf_counter(), 0
+        if options['workers'] > 1:
+            # Children only generate data; close connections so none is shared across the fork.
+            connections.close_all()
+            with multiprocessing.Pool(options['workers']) as pool:
+                done = self.load(pool.imap(generate_batch, specs), insert, posts)
+        else:
+            done = self.load(map(generate_batch, specs), insert, posts)
+
+        if method == 'copy':
+            # COPY bypasses the ORM; with no ids this only drops the cached post lists.
+            posts_changed.send(sender=Post, post_ids=[])
+            feed.rebuild()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Database successfully seeded! {done} posts, {done * per_post} comments '
+            f'in {elapsed:.1f}s ({done * (1 + per_post) / max(elapsed, 1e-9):,.0f} rows/s)'))
+
+    def load(self, batches, insert, total):
+        done = 0
+        for batch in batches:
+            with transaction.atomic():
+                insert(batch)
+            done += len(batch)
+            if self.verbosity > 1:
+                self.stdout.write(f'{done}/{total} posts')
+        return done
@@ -0,0 +1,35 @@
+import os
+import sys
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ('Runs the production server: gunicorn with a worker per core on config.wsgi, or uvicorn '
+            'workers on config.asgi with --asgi. Settings are in config/gunicorn.conf.py.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--asgi', action='store_true', help='Serve config.asgi with uvicorn workers')
+        parser.add_argument('--bind', help='Address to listen on (SERVER_BIND, default 0.0.0.0:8000)')
+        parser.add_argument('--workers', type=int, help='Worker processes (WEB_CONCURRENCY, default from the core count)')
+        parser.add_argument('--skip-collectstatic', action='store_true',
+                            help='Do not collect static files into STATIC_ROOT first')
+
+    def handle(self, *args, **options):
+        if not options['skip_collectstatic']:
+            call_command('collectstatic', interactive=False, verbosity=0)
+
+        env = {'SERVER_INTERFACE': 'asgi' if options['asgi'] else 'wsgi'}
+        if options['bind']:
+            env['SERVER_BIND'] = options['bind']
+        if options['workers']:
+            env['WEB_CONCURRENCY'] = str(options['workers'])
+        os.environ.update(env)
+
+        config = os.path.join(settings.BASE_DIR, 'config', 'gunicorn.conf.py')
+        app = 'config.asgi:application' if options['asgi'] else 'config.wsgi:application'
+        sys.stdout.flush()
+        # Replace this process, so the signals of the container runtime reach the gunicorn master.
+        os.execvp(sys.executable, [sys.executable, '-m', 'gunicorn', '--config', config, app])
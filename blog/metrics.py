@@ -0,0 +1,233 @@
+"""
+Per-route request metrics, exposed in the Prometheus text format.
+
+`MetricsMiddleware` records, for every request, the wall time, the number of
+queries and the time spent in them, and the time spent rendering the body,
+under the resolved route name. Queries are counted by an execute wrapper that
+every connection gets when it opens (see signals.py); it only does work while
+a request is being measured, so it costs two perf_counter() calls per query.
+
+Histograms live in process memory: with several worker processes each one
+reports its own series, the way Prometheus client libraries behave too.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from ninja.renderers import JSONRenderer
+from rest_framework.renderers import BaseRenderer
+
+logger = logging.getLogger('blog.metrics')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+METRICS = {
+    'blog_request_duration_seconds': ('Wall time of the request in the view stack', LATENCY_BUCKETS),
+    'blog_db_queries': ('Database queries run by the request', QUERY_BUCKETS),
+    'blog_db_duration_seconds': ('Time the request spent in database queries', LATENCY_BUCKETS),
+    'blog_serialization_duration_seconds': ('Time spent rendering the response body', LATENCY_BUCKETS),
+    'blog_db_pool_wait_seconds': ('Time spent waiting for a free pooled connection', LATENCY_BUCKETS),
+}
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        # Buckets are upper bounds, inclusive, like Prometheus' `le`.
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, labels, **values):
+        with self._lock:
+            for name, value in values.items():
+                key = (name, labels)
+                histogram = self._series.get(key)
+                if histogram is None:
+                    histogram = self._series[key] = Histogram(METRICS[name][1])
+                histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        with self._lock:
+            series = sorted((key, list(h.counts), h.sum) for key, h in self._series.items())
+        lines = []
+        for name, (help_text, buckets) in METRICS.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            for (series_name, labels), counts, total in series:
+                if series_name != name:
+                    continue
+                label = ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{label}}} {total}')
+                lines.append(f'{name}_count{{{label}}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+registry = Registry()
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'serialization', 'sql')
+
+    def __init__(self, capture_sql=False):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialization = 0.0
+        self.sql = [] if capture_sql else None
+
+
+# The request being measured. A ContextVar rather than a thread local so the
+# async ORM's worker threads, which run in a copy of the context, record into it.
+_current = ContextVar('blog_request_stats', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        stats.queries += 1
+        stats.db_time += elapsed
+        if stats.sql is not None:
+            stats.sql.append((elapsed, sql))
+
+
+def install(connection):
+    """Adds the query recorder to `connection`, once."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def serializing():
+    """Counts the block as serialization time of the current request."""
+    stats = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            stats.serialization += time.perf_counter() - start
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """Ninja's JSON renderer, timed: Ninja renders inside the view, not in a TemplateResponse."""
+
+    def render(self, request, data, *, response_status):
+        with serializing():
+            return super().render(request, data, response_status=response_status)
+
+
+class PrometheusTextRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data if isinstance(data, str) else str(data)
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+class MetricsMiddleware:
+    """
+    Records the request metrics above. With BLOG_SLOW_REQUEST_MS set, requests
+    slower than that are logged to `blog.metrics` with the SQL they ran.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'BLOG_METRICS', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_threshold = getattr(settings, 'BLOG_SLOW_REQUEST_MS', 0) / 1000
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, stats, start)
+        return response
+
+    async def __acall__(self, request):
+        stats, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, stats, start)
+        return response
+
+    def start(self):
+        stats = RequestStats(capture_sql=bool(self.slow_threshold))
+        return stats, _current.set(stats), time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time that render.
+        stats, start = _current.get(), time.perf_counter()
+        if stats is not None:
+            def rendered(response):
+                stats.serialization += time.perf_counter() - start
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, stats, start):
+        elapsed = time.perf_counter() - start
+        route = route_name(request)
+        registry.observe(
+            (('route', route), ('method', request.method)),
+            blog_request_duration_seconds=elapsed,
+            blog_db_queries=stats.queries,
+            blog_db_duration_seconds=stats.db_time,
+            blog_serialization_duration_seconds=stats.serialization,
+        )
+        if self.slow_threshold and elapsed >= self.slow_threshold:
+            logger.warning(
+                'Slow request %s %s (%s): %.1f ms, %d queries in %.1f ms, status %s\n%s',
+                request.method, request.get_full_path(), route, elapsed * 1000, stats.queries,
+                stats.db_time * 1000, response.status_code,
+                '\n'.join(f'  {duration * 1000:.1f} ms  {sql}' for duration, sql in stats.sql),
+            )
@@ -1,22 +1,213 @@
-from django.db import models
+from collections import Counter
+
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models import Count, F
 
 # Create your models here.
 
+EXCERPT_LENGTH = 280
+
+
+def make_excerpt(content, length=EXCERPT_LENGTH):
+    """The start of `content` with whitespace collapsed, cut at a word boundary."""
+    text = ' '.join(content.split())
+    if len(text) <= length:
+        return text
+    return text[:length + 1].rsplit(' ', 1)[0][:length] + '…'
+
+
+class PostQuerySet(models.QuerySet):
+    def _changed(self, post_ids):
+        from .signals import posts_changed
+
+        if post_ids:
+            posts_changed.send(sender=Post, post_ids=post_ids)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.excerpt = make_excerpt(obj.content)
+        objs = super().bulk_create(objs, *args, **kwargs)
+        self._changed([obj.pk for obj in objs])
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if 'content' in fields:
+            for obj in objs:
+                obj.excerpt = make_excerpt(obj.content)
+            fields = [*fields, 'excerpt']
+        result = super().bulk_update(objs, fields, *args, **kwargs)
+        self._changed([obj.pk for obj in objs])
+        return result
+
+    def add_comment_counts(self, deltas):
+        """Applies `{post_id: delta}` to the denormalized comment_count column."""
+        changed = [post_id for post_id, delta in deltas.items() if delta]
+        for post_id in changed:
+            self.filter(pk=post_id).update(comment_count=F('comment_count') + deltas[post_id])
+        self._changed(changed)
+
+# Post columns that only updates in the database change: never written back by save().
+DATABASE_MAINTAINED_FIELDS = ('comment_count', 'search_vector')
+
 class Post(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
+    # Computed from content on every write, so list views can skip the content column.
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH + 1, blank=True, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    # Maintained by a database trigger, see blog.search.
+    search_vector = SearchVectorField(null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='post_created_id_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        deferred = self.get_deferred_fields()
+        if 'content' not in deferred:
+            self.excerpt = make_excerpt(self.content)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            # The columns kept up to date by the database would be written back as loaded, undoing
+            # comment count changes made since; an edit writes every other loaded column.
+            update_fields = [field.attname for field in self._meta.concrete_fields
+                             if not field.primary_key and field.attname not in deferred
+                             and field.name not in DATABASE_MAINTAINED_FIELDS]
+        if update_fields is not None and 'content' in update_fields:
+            update_fields = {*update_fields, 'excerpt'}
+        if update_fields is not None:
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
+# What the API reads of a comment, and of its post when it is embedded.
+COMMENT_API_FIELDS = ('id', 'post', 'text', 'email')
+POST_SUMMARY_FIELDS = ('id', 'title', 'created_at')
+
+class CommentReadQuerySet(models.QuerySet):
+    def for_api(self, embed_post=False):
+        """
+        Only the columns the API returns. With `embed_post`, each comment's post
+        summary is joined into the same query instead of fetched per comment.
+        """
+        if not embed_post:
+            return self.only(*COMMENT_API_FIELDS)
+        return self.select_related('post').only(
+            *COMMENT_API_FIELDS, *(f'post__{field}' for field in POST_SUMMARY_FIELDS))
+
+class CommentQuerySet(CommentReadQuerySet):
+    # Every way of adding or removing comments keeps Post.comment_count in step,
+    # except the cascade from deleting the post itself, where it no longer matters.
+    def bulk_create(self, objs, *args, update_counts=True, **kwargs):
+        """Pass `update_counts=False` only when the caller sets comment_count itself."""
+        from .signals import comments_created
+
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            if update_counts:
+                Post.objects.add_comment_counts(Counter(obj.post_id for obj in objs))
+            comments_created.send(sender=Comment, comments=objs)
+        return objs
+
+    def delete(self, update_counts=True):
+        """`update_counts=False` leaves comment_count alone, for comments that move to the archive."""
+        if not update_counts:
+            return super().delete()
+        with transaction.atomic(using=self.db):
+            per_post = self.order_by().values('post_id').annotate(n=Count('pk')).values_list('post_id', 'n')
+            deltas = {post_id: -n for post_id, n in per_post}
+            result = super().delete()
+            Post.objects.add_comment_counts(deltas)
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
 class Comment(models.Model):
-    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    # The (post, id) index below serves post_id lookups too, so the FK skips its own.
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, db_index=False)
+    text = models.TextField()
+    email = models.EmailField()
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Set on comments that came through the write-behind queue, see blog.writebehind.
+    ticket = models.UUIDField(null=True, blank=True, unique=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'id'], name='comment_post_id_idx'),
+            # Finds the comments old enough to archive, see blog.archive.
+            models.Index(fields=['created_at'], name='comment_created_idx'),
+        ]
+
+    def __str__(self):
+        # The post's title only if it was loaded along with the comment: never a query per comment.
+        post = self.post if Comment.post.is_cached(self) else f'post {self.post_id}'
+        return f"Comment by {self.email} on {post}"
+
+    def save(self, *args, **kwargs):
+        from .signals import comments_created
+
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic():
+            old_post_id = None
+            if not adding and (update_fields is None or 'post' in update_fields or 'post_id' in update_fields):
+                # A comment moved to another post counts there instead.
+                old_post_id = (Comment.objects.select_for_update().filter(pk=self.pk)
+                               .values_list('post_id', flat=True).first())
+            super().save(*args, **kwargs)
+            if adding:
+                Post.objects.add_comment_counts({self.post_id: 1})
+                comments_created.send(sender=Comment, comments=[self])
+            elif old_post_id is not None and old_post_id != self.post_id:
+                Post.objects.add_comment_counts({old_post_id: -1, self.post_id: 1})
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Post.objects.add_comment_counts({self.post_id: -1})
+        return result
+
+
+class ArchivedComment(models.Model):
+    """A comment moved out of the comment table by blog.archive, under its original id."""
+    id = models.BigIntegerField(primary_key=True)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, db_index=False, related_name='archived_comments')
     text = models.TextField()
     email = models.EmailField()
+    created_at = models.DateTimeField()
+
+    objects = CommentReadQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'id'], name='archived_comment_post_id_idx'),
+        ]
 
     def __str__(self):
-        return f"Comment by {self.email} on {self.post}"
-    
-    
\ No newline at end of file
+        return f"Archived comment by {self.email} on post {self.post_id}"
+
+
+class FeedEntry(models.Model):
+    """A post as the feed serves it, rendered to JSON ahead of time; kept up to date by blog.feed."""
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='feed_entry')
+    created_at = models.DateTimeField()
+    body = models.TextField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'post'], name='feed_created_post_idx'),
+        ]
@@ -0,0 +1,198 @@
+import base64
+import json
+from typing import Any, List, Optional
+
+from django.conf import settings
+from django.db.models import Q
+from ninja import Field, Schema
+from ninja.errors import HttpError
+from ninja.pagination import PaginationBase
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class Keyset:
+    """
+    Keyset (seek) pagination over a fixed ordering such as ('-created_at', '-id').
+
+    The cursor is the ordering values of the last row of a page, so the next page
+    is fetched with a `WHERE (a, b) < (x, y)` style filter on an index instead of
+    an OFFSET, and costs the same no matter how deep the client has paged.
+    The last field must be unique (normally the primary key).
+    """
+
+    def __init__(self, *ordering):
+        self.ordering = ordering
+        self.fields = [name.lstrip('-') for name in ordering]
+
+    def encode(self, item):
+        values = []
+        for name in self.fields:
+            value = item[name] if isinstance(item, dict) else getattr(item, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        raw = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode(self, cursor, model):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            return [model._meta.get_field(name).to_python(value) for name, value in zip(self.fields, values)]
+        except Exception:
+            raise InvalidCursor(cursor)
+
+    def seek(self, queryset, values):
+        """Rows strictly after `values` in this ordering."""
+        condition = Q()
+        for i, name in enumerate(self.ordering):
+            field = self.fields[i]
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            step = Q(**{f'{field}__{lookup}': values[i]})
+            for prev, value in zip(self.fields[:i], values[:i]):
+                step &= Q(**{prev: value})
+            condition |= step
+        return queryset.filter(condition)
+
+    def page_queryset(self, queryset, cursor, limit):
+        queryset = queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = self.seek(queryset, self.decode(cursor, queryset.model))
+        return queryset[:limit + 1]
+
+    def page(self, items, limit):
+        if len(items) > limit:
+            items = items[:limit]
+            return items, self.encode(items[-1])
+        return items, None
+
+    def merge(self, pages):
+        """Several pages, each in this ordering, as one."""
+        items = [item for page in pages for item in page]
+        # One stable sort per field, least significant first.
+        for name, field in reversed(list(zip(self.ordering, self.fields))):
+            items.sort(key=lambda item: item[field] if isinstance(item, dict) else getattr(item, field),
+                       reverse=name.startswith('-'))
+        return items
+
+    def paginate(self, queryset, cursor=None, limit=None):
+        """
+        Returns `(items, next_cursor)`; `next_cursor` is None on the last page.
+        `queryset` can also be a list of querysets with the same ordering fields
+        and disjoint keys, such as recent and archived comments: each is paged
+        and the pages merged.
+        """
+        if isinstance(queryset, list):
+            return self.page(self.merge([list(self.page_queryset(qs, cursor, limit)) for qs in queryset]), limit)
+        return self.page(list(self.page_queryset(queryset, cursor, limit)), limit)
+
+    async def apaginate(self, queryset, cursor=None, limit=None):
+        if isinstance(queryset, list):
+            pages = [[item async for item in self.page_queryset(qs, cursor, limit)] for qs in queryset]
+            return self.page(self.merge(pages), limit)
+        items = [item async for item in self.page_queryset(queryset, cursor, limit)]
+        return self.page(items, limit)
+
+
+POST_KEYSET = Keyset('-created_at', '-id')
+COMMENT_KEYSET = Keyset('id')
+
+
+def get_limit(value):
+    default = settings.BLOG_PAGE_SIZE
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return default
+    if limit < 1:
+        return default
+    return min(limit, settings.BLOG_MAX_PAGE_SIZE)
+
+
+def next_link(request, cursor):
+    if cursor is None:
+        return None
+    return replace_query_param(request.build_absolute_uri(), 'cursor', cursor)
+
+
+# Django Rest Framework
+class KeysetPagination(BasePagination):
+    keyset = None
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        cursor = request.query_params.get(self.cursor_query_param)
+        limit = get_limit(request.query_params.get(self.limit_query_param))
+        try:
+            items, self.next_cursor = self.keyset.paginate(queryset, cursor, limit)
+        except InvalidCursor:
+            raise NotFound('Invalid cursor')
+        return items
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': next_link(self.request, self.next_cursor),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class PostPagination(KeysetPagination):
+    keyset = POST_KEYSET
+
+
+class CommentPagination(KeysetPagination):
+    keyset = COMMENT_KEYSET
+
+
+# Django Ninja
+class NinjaKeysetPagination(PaginationBase):
+    class Input(Schema):
+        cursor: Optional[str] = None
+        limit: Optional[int] = Field(None, ge=1)
+
+    class Output(Schema):
+        next: Optional[str] = None
+        results: List[Any]
+
+    items_attribute = 'results'
+
+    def __init__(self, keyset=POST_KEYSET, **kwargs):
+        self.keyset = keyset
+        super().__init__(**kwargs)
+
+    def paginate_queryset(self, queryset, pagination: Input, request, **params):
+        try:
+            items, cursor = self.keyset.paginate(queryset, pagination.cursor, get_limit(pagination.limit))
+        except InvalidCursor:
+            raise HttpError(404, 'Invalid cursor')
+        return {'next': next_link(request, cursor), 'results': items}
+
+
+async def apaginate(keyset, queryset, request, cursor=None, limit=None):
+    """The async counterpart of NinjaKeysetPagination, for handlers that cannot use `@paginate`."""
+    try:
+        items, cursor = await keyset.apaginate(queryset, cursor, get_limit(limit))
+    except InvalidCursor:
+        raise HttpError(404, 'Invalid cursor')
+    return {'next': next_link(request, cursor), 'results': items}
@@ -0,0 +1,194 @@
+"""
+An in-process database connection pool, switched on with DB_POOL_SIZE.
+
+Django opens a connection per thread and, with CONN_MAX_AGE=0, closes it when
+the request ends; under ASGI every request runs in a fresh thread, so even a
+persistent CONN_MAX_AGE does not help there. The pooled backends in
+blog/backends keep Django's behaviour but take connections from a per-alias,
+per-process pool in `get_new_connection` and hand them back (rolled back) in
+`_close`, so a request only pays for a real connect when the pool is empty.
+
+At most SIZE connections are open per alias and process. A thread that finds
+them all in use waits up to TIMEOUT seconds and then gets an OperationalError.
+
+An idle connection can die under the pool (a database restart, a server-side
+idle timeout). Before handing one out that has been idle for CHECK_AFTER
+seconds, or always with CONN_HEALTH_CHECKS on, the pool pings it with
+`SELECT 1`; a dead one is discarded and the next one, or a new one, is taken.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import closing
+
+from .metrics import registry
+
+# Seconds a connection may sit idle before it is pinged on checkout.
+CHECK_AFTER = 30.0
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, size, timeout, alias='default', check_after=CHECK_AFTER):
+        self.alias = alias
+        self.size = size
+        self.timeout = timeout
+        self.check_after = check_after
+        # (connection, time.monotonic() when it was released), most recent last.
+        self._idle = deque()
+        self._open = 0
+        self._available = threading.Condition()
+        self.waits = 0
+        self.timeouts = 0
+        self.connects = 0
+
+    def acquire(self, connect, ping=None):
+        """
+        An idle connection, or a new one from `connect()` while fewer than `size`
+        are open. `ping(connection)` tells whether an idle connection still works.
+        """
+        while True:
+            with self._available:
+                if not self._idle and self._open >= self.size:
+                    self.waits += 1
+                    start = time.perf_counter()
+                    if not self._available.wait_for(lambda: self._idle or self._open < self.size, self.timeout):
+                        self.timeouts += 1
+                        raise PoolTimeout(f'No database connection free after {self.timeout}s '
+                                          f'({self.size} in use)')
+                    registry.observe((('alias', self.alias),), blog_db_pool_wait_seconds=time.perf_counter() - start)
+                if not self._idle:
+                    self._open += 1
+                    break
+                connection, released_at = self._idle.pop()
+            if ping is None or time.monotonic() - released_at < self.check_after or ping(connection):
+                return connection
+            self.discard(connection)
+        try:
+            connection = connect()
+        except BaseException:
+            self.discard(None)
+            raise
+        with self._available:
+            self.connects += 1
+        return connection
+
+    def release(self, connection):
+        try:
+            # Whatever the last user left open must not leak into the next one.
+            connection.rollback()
+        except Exception:
+            self.discard(connection)
+            return
+        with self._available:
+            self._idle.append((connection, time.monotonic()))
+            self._available.notify()
+
+    def discard(self, connection):
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        with self._available:
+            self._open -= 1
+            self._available.notify()
+
+    def close_idle(self):
+        with self._available:
+            idle, self._idle = list(self._idle), deque()
+        for connection, _ in idle:
+            self.discard(connection)
+
+    def stats(self):
+        with self._available:
+            idle = len(self._idle)
+            return {'size': self.size, 'open': self._open, 'idle': idle, 'in_use': self._open - idle,
+                    'waits': self.waits, 'timeouts': self.timeouts, 'connects': self.connects}
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, size, timeout, check_after=CHECK_AFTER):
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None:
+            pool = _pools[alias] = ConnectionPool(size, timeout, alias, check_after)
+        return pool
+
+
+def ping(connection):
+    """Whether a DB-API `connection` answers `SELECT 1`."""
+    try:
+        with closing(connection.cursor()) as cursor:
+            cursor.execute('SELECT 1')
+        # Leaves no transaction open for the autocommit switch that follows a checkout.
+        connection.rollback()
+    except Exception:
+        return False
+    return True
+
+
+def close_all():
+    """Closes the idle connections of every pool, e.g. in a server master before it forks."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_idle()
+
+
+class PooledDatabaseWrapper:
+    """Mixed in before a backend's DatabaseWrapper; see blog/backends."""
+
+    @property
+    def pool(self):
+        options = self.settings_dict.get('POOL') or {}
+        check_after = 0.0 if self.settings_dict.get('CONN_HEALTH_CHECKS') else CHECK_AFTER
+        return get_pool(self.alias, options.get('SIZE', 10), options.get('TIMEOUT', 10.0), check_after)
+
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        try:
+            return self.pool.acquire(lambda: connect(conn_params), ping)
+        except PoolTimeout as e:
+            # Raised inside wrap_database_errors, so callers see django.db.OperationalError.
+            raise self.Database.OperationalError(str(e)) from e
+
+    def _close(self):
+        if self.connection is not None:
+            self.pool.release(self.connection)
+
+
+GAUGES = {
+    'blog_db_pool_connections': ('gauge', 'Pooled database connections by state'),
+    'blog_db_pool_waits_total': ('counter', 'Checkouts that had to wait for a free connection'),
+    'blog_db_pool_timeouts_total': ('counter', 'Checkouts that gave up after the pool timeout'),
+    'blog_db_pool_connects_total': ('counter', 'Real connections opened by the pool'),
+}
+
+
+def render():
+    """The pools of this process in the Prometheus text format, labelled with its pid."""
+    with _pools_lock:
+        pools = sorted(_pools.items())
+    worker = os.getpid()
+    values = {name: [] for name in GAUGES}
+    for alias, pool in pools:
+        stats = pool.stats()
+        label = f'alias="{alias}",worker="{worker}"'
+        for state in ('in_use', 'idle'):
+            values['blog_db_pool_connections'].append(f'{{{label},state="{state}"}} {stats[state]}')
+        values['blog_db_pool_waits_total'].append(f'{{{label}}} {stats["waits"]}')
+        values['blog_db_pool_timeouts_total'].append(f'{{{label}}} {stats["timeouts"]}')
+        values['blog_db_pool_connects_total'].append(f'{{{label}}} {stats["connects"]}')
+    lines = []
+    for name, (kind, help_text) in GAUGES.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        lines += [name + value for value in values[name]]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,221 @@
+"""
+New comments pushed to subscribers as Server-Sent Events (ASGI only).
+
+Comments are published on commit from the comments_created signal, through
+Redis pub/sub when REDIS_URL is set, otherwise in-process. A subscriber more
+than BLOG_PUSH_BUFFER events behind is sent `overflow` and disconnected; it
+can reconnect with Last-Event-ID to replay what it missed.
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+
+from .models import Comment
+from .renderers import dumps
+
+logger = logging.getLogger('blog.push')
+
+CHANNEL = 'blog:push:post:{}'
+CHANNEL_PATTERN = CHANNEL.format('*')
+
+RETRY = b'retry: 3000\n\n'
+KEEP_ALIVE = b': keep-alive\n\n'
+OVERFLOW = b'event: overflow\ndata: {}\n\n'
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+def render_event(comment):
+    # The comment as CommentSerializer gives it, framed as an SSE event with its id.
+    data = dumps({'id': comment.pk, 'text': comment.text, 'email': comment.email, 'post': comment.post_id})
+    return b'id: %d\nevent: comment\ndata: %s\n\n' % (comment.pk, data)
+
+
+def event_id(event):
+    return int(event[4:event.index(b'\n')])
+
+
+class Subscription:
+    __slots__ = ('post_id', 'loop', 'queue', 'overflowed')
+
+    def __init__(self, post_id, size):
+        self.post_id = post_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(size)
+        self.overflowed = False
+
+    def offer(self, event):
+        """Runs on the subscriber's loop. A full buffer marks a slow consumer instead of growing."""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class Broker:
+    """The subscribers of this process, by post."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+        self.count = 0
+
+    def subscribe(self, post_id):
+        with self._lock:
+            if self.count >= settings.BLOG_PUSH_MAX_SUBSCRIBERS:
+                raise TooManySubscribers
+            subscription = Subscription(post_id, settings.BLOG_PUSH_BUFFER)
+            self._subscriptions[post_id].add(subscription)
+            self.count += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.post_id)
+            if subscriptions is not None and subscription in subscriptions:
+                subscriptions.remove(subscription)
+                self.count -= 1
+                if not subscriptions:
+                    del self._subscriptions[subscription.post_id]
+
+    def dispatch(self, post_id, event):
+        """Hands `event` to the subscribers of `post_id`; safe to call from any thread."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(post_id, ()))
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        for subscription in subscriptions:
+            if subscription.loop is running:
+                subscription.offer(event)
+            else:
+                try:
+                    subscription.loop.call_soon_threadsafe(subscription.offer, event)
+                except RuntimeError:
+                    # Its loop has closed; the subscription is going away.
+                    pass
+
+
+broker = Broker()
+
+
+@lru_cache(maxsize=None)
+def _redis(url):
+    import redis
+
+    # Publishing runs after the comment has committed: a slow Redis must not hold up the response.
+    return redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+
+
+def publish(events):
+    """
+    Publishes `[(post_id, event), ...]` to every subscriber, in this process
+    and, with Redis, all others. Events that Redis cannot take are dropped and
+    logged; subscribers catch up with Last-Event-ID when they reconnect.
+    """
+    if settings.REDIS_URL:
+        import redis
+
+        pipe = _redis(settings.REDIS_URL).pipeline(transaction=False)
+        for post_id, event in events:
+            pipe.publish(CHANNEL.format(post_id), event)
+        try:
+            pipe.execute()
+        except redis.RedisError:
+            logger.exception('Could not publish %d comment events to Redis', len(events))
+    else:
+        for post_id, event in events:
+            broker.dispatch(post_id, event)
+
+
+# One Redis relay task per event loop; normally one loop per worker process.
+_relays = {}
+
+
+async def relay(url):
+    """Feeds this process's broker from Redis until cancelled, reconnecting on errors."""
+    import redis.asyncio
+
+    while True:
+        try:
+            client = redis.asyncio.Redis.from_url(url)
+            async with client.pubsub() as pubsub:
+                await pubsub.psubscribe(CHANNEL_PATTERN)
+                async for message in pubsub.listen():
+                    if message['type'] == 'pmessage':
+                        broker.dispatch(int(message['channel'].rsplit(b':', 1)[1]), message['data'])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception('Comment push relay from Redis failed, reconnecting')
+            await asyncio.sleep(1)
+
+
+def ensure_relay():
+    if not settings.REDIS_URL:
+        return
+    loop = asyncio.get_running_loop()
+    task = _relays.get(loop)
+    if task is None or task.done():
+        _relays[loop] = loop.create_task(relay(settings.REDIS_URL))
+
+
+class CommentStream:
+    """
+    The SSE stream of a post's new comments, starting after `last_event_id` if
+    given. Subscribes on creation, so it raises TooManySubscribers right away.
+    `close()` is called by the response once it is done with the stream.
+    """
+
+    def __init__(self, post_id, last_event_id=None):
+        ensure_relay()
+        # Subscribed before the replay query, so no comment falls between the two.
+        self.subscription = broker.subscribe(post_id)
+        self.events = self._events(post_id, last_event_id)
+
+    def __aiter__(self):
+        return self.events
+
+    def close(self):
+        broker.unsubscribe(self.subscription)
+
+    async def _events(self, post_id, last_event_id):
+        subscription = self.subscription
+        try:
+            yield RETRY
+            last = last_event_id or 0
+            if last_event_id is not None:
+                limit = settings.BLOG_PUSH_BUFFER
+                missed = Comment.objects.filter(post_id=post_id, pk__gt=last_event_id).order_by('pk')[:limit + 1]
+                replayed = 0
+                async for comment in missed:
+                    replayed += 1
+                    if replayed > limit:
+                        # More than a buffer behind: the client should page through the comments instead.
+                        yield OVERFLOW
+                        return
+                    last = comment.pk
+                    yield render_event(comment)
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), settings.BLOG_PUSH_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle stream, and finds clients that went away.
+                    yield KEEP_ALIVE
+                    continue
+                if subscription.overflowed:
+                    yield OVERFLOW
+                    return
+                if event_id(event) > last:
+                    yield event
+        finally:
+            self.close()
@@ -0,0 +1,219 @@
+"""
+Per-client rate limits: `read`, `write` and `bulk` budgets of
+`<requests>/<s|min|hour|day>` (BLOG_RATE_*), answered 429 with Retry-After.
+
+Budgets are spent before authentication, keyed by user when the session or
+cached token is known, otherwise by address. DRF views are limited by
+`RateLimitAuthentication`, Ninja handlers by `rate_limited(budget)`. Buckets
+are GCRA timestamps in Redis, or in process memory without it.
+"""
+import logging
+import math
+import threading
+import time
+from functools import lru_cache, wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import Throttled
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+from .auth import token_key
+from .cache import get_cache
+
+logger = logging.getLogger('blog.ratelimit')
+
+RATE_KEY = 'blog:ratelimit:{}:{}'
+PERIODS = {'s': 1, 'min': 60, 'hour': 3600, 'day': 86400}
+# Seconds to stay on the in-memory buckets after Redis fails.
+REDIS_RETRY = 5
+
+
+class RateLimited(Exception):
+    def __init__(self, wait):
+        super().__init__(wait)
+        self.wait = wait
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """'<requests>/<period>' as (requests, seconds)."""
+    count, _, period = rate.partition('/')
+    return int(count), PERIODS[period.strip()]
+
+
+def get_rate(budget):
+    return parse_rate(getattr(settings, f'BLOG_RATE_{budget.upper()}'))
+
+
+class MemoryBuckets:
+    """Buckets of this process; the fallback without Redis."""
+
+    def __init__(self, max_keys=100000):
+        self._lock = threading.Lock()
+        self._full_at = {}
+        self.max_keys = max_keys
+
+    def spend(self, key, interval, period):
+        now = time.monotonic()
+        with self._lock:
+            full_at = max(self._full_at.get(key, now), now) + interval
+            wait = full_at - period - now
+            if wait > 0:
+                return wait
+            self._full_at[key] = full_at
+            if len(self._full_at) > self.max_keys:
+                # Full buckets hold nothing worth keeping.
+                self._full_at = {k: v for k, v in self._full_at.items() if v > now}
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._full_at.clear()
+
+
+class RedisBuckets:
+    # GCRA on the Redis clock, so workers with skewed clocks agree.
+    SPEND = """
+        local t = redis.call('TIME')
+        local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+        local full_at = math.max(tonumber(redis.call('GET', KEYS[1]) or 0), now) + tonumber(ARGV[1])
+        local wait = full_at - tonumber(ARGV[2]) - now
+        if wait > 0 then return tostring(wait) end
+        redis.call('SET', KEYS[1], string.format('%.6f', full_at), 'PX', math.ceil((full_at - now) * 1000))
+        return false
+    """
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.1, socket_connect_timeout=0.1)
+        self._spend = self.client.register_script(self.SPEND)
+
+    def spend(self, key, interval, period):
+        wait = self._spend(keys=[key], args=[repr(interval), period])
+        return float(wait) if wait is not None else None
+
+
+memory = MemoryBuckets()
+# time.monotonic() until which Redis is skipped after a failure.
+_redis_down_until = 0.0
+
+
+@lru_cache(maxsize=None)
+def _redis_buckets(url):
+    return RedisBuckets(url)
+
+
+def spend(budget, client):
+    """Takes a request from `client`'s `budget`; returns None, or the seconds to wait when it is spent."""
+    global _redis_down_until
+    count, period = get_rate(budget)
+    key = RATE_KEY.format(budget, client)
+    if settings.REDIS_URL and time.monotonic() >= _redis_down_until:
+        import redis
+
+        try:
+            return _redis_buckets(settings.REDIS_URL).spend(key, period / count, period)
+        except redis.RedisError as e:
+            logger.warning('Rate limiting in process memory, Redis failed: %s', e)
+            _redis_down_until = time.monotonic() + REDIS_RETRY
+    return memory.spend(key, period / count, period)
+
+
+def _token_cache_key(authorization):
+    keyword, _, key = (authorization or '').partition(' ')
+    return token_key(key.strip()) if keyword == 'Token' and key.strip() else None
+
+
+def client_address(request):
+    """The client's address for Django and DRF requests alike, trusting NUM_PROXIES of X-Forwarded-For as DRF does."""
+    return BaseThrottle().get_ident(request)
+
+
+def client_id(user, authorization, address):
+    if user.is_authenticated:
+        return f'user:{user.pk}'
+    key = _token_cache_key(authorization)
+    entry = get_cache().get(key) if key is not None else None
+    return f'user:{entry[0]}' if entry is not None else f'ip:{address}'
+
+
+async def aclient_id(user, authorization, address):
+    if user.is_authenticated:
+        return f'user:{user.pk}'
+    key = _token_cache_key(authorization)
+    entry = await get_cache().aget(key) if key is not None else None
+    return f'user:{entry[0]}' if entry is not None else f'ip:{address}'
+
+
+def check(budget, client):
+    """Raises RateLimited when `client` has spent `budget`."""
+    if not settings.BLOG_RATELIMIT:
+        return
+    wait = spend(budget, client)
+    if wait is not None:
+        raise RateLimited(wait)
+
+
+async def acheck(budget, client):
+    if not settings.BLOG_RATELIMIT:
+        return
+    if settings.REDIS_URL:
+        # Not thread sensitive: the Redis round trips of concurrent requests must not queue on one thread.
+        wait = await sync_to_async(spend, thread_sensitive=False)(budget, client)
+    else:
+        wait = spend(budget, client)
+    if wait is not None:
+        raise RateLimited(wait)
+
+
+def retry_after(wait):
+    return str(max(1, math.ceil(wait)))
+
+
+# Django Rest Framework
+class RateLimitAuthentication(BaseAuthentication):
+    """Spends the request's budget, then leaves authentication to the classes after it."""
+
+    def authenticate(self, request):
+        view = request.parser_context.get('view')
+        budget = getattr(view, 'rate_budget', None) or ('read' if request.method in SAFE_METHODS else 'write')
+        # The Django request's user: a session, resolved through the cache by the middleware.
+        client = client_id(request._request.user, request.META.get('HTTP_AUTHORIZATION'), client_address(request))
+        try:
+            check(budget, client)
+        except RateLimited as e:
+            raise Throttled(e.wait)
+        return None
+
+
+# Django Ninja
+def rate_limited(budget):
+    """Spends from `budget` before the handler runs; for sync and async handlers."""
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                client = await aclient_id(await request.auser(), request.META.get('HTTP_AUTHORIZATION'),
+                                          client_address(request))
+                await acheck(budget, client)
+                return await view(request, *args, **kwargs)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                client = client_id(request.user, request.META.get('HTTP_AUTHORIZATION'), client_address(request))
+                check(budget, client)
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def rate_limited_response(api, request, exc):
+    response = api.create_response(
+        request, {'detail': f'Request was throttled. Expected available in {retry_after(exc.wait)} seconds.'},
+        status=429)
+    response['Retry-After'] = retry_after(exc.wait)
+    return response
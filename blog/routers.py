@@ -0,0 +1,154 @@
+"""
+Read replicas.
+
+With DB_REPLICA_URLS set, `ReplicaRouter` sends reads of the blog models to
+BLOG_READ_REPLICAS, round robin, and every write to `default`. Reads stay on
+`default` for unsafe methods, inside transactions, inside `primary()` (cache
+fills), for BLOG_REPLICA_STICKY_SECONDS after a client writes, and while no
+replica answers. `manage.py copy_to_replicas` refreshes SQLite replicas locally.
+"""
+import hashlib
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from .cache import get_cache
+
+logger = logging.getLogger('blog.routers')
+
+PIN_KEY = 'blog:replica:pin:{}'
+ROUTED_APPS = {'blog'}
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Whether the current request must read from the primary; see ReplicaPinMiddleware.
+_pinned = ContextVar('blog_replica_pinned', default=None)
+# alias -> time.monotonic() after which a failed replica is tried again.
+_down = {}
+
+
+class Pin:
+    __slots__ = ('pinned', 'wrote', 'checked')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        # Replicas whose connection this request has already checked.
+        self.checked = set()
+
+
+def healthy(alias, pin=None):
+    retry_at = _down.get(alias)
+    if retry_at is not None and time.monotonic() < retry_at:
+        return False
+    connection = connections[alias]
+    try:
+        if connection.connection is not None and pin is not None and alias not in pin.checked:
+            # Opened by an earlier request: the replica may have gone away since.
+            pin.checked.add(alias)
+            if not connection.is_usable():
+                connection.close()
+        connection.ensure_connection()
+    except DatabaseError as e:
+        logger.warning('Read replica %s is unavailable, reading from %s: %s', alias, DEFAULT_DB_ALIAS, e)
+        _down[alias] = time.monotonic() + settings.BLOG_REPLICA_RETRY_SECONDS
+        return False
+    _down.pop(alias, None)
+    return True
+
+
+@contextmanager
+def primary():
+    """Reads the blog models from the primary inside the block, e.g. to fill a cache shared by every client."""
+    outer = _pinned.get()
+    pin = Pin(pinned=True)
+    token = _pinned.set(pin)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+        if pin.wrote and outer is not None:
+            outer.pinned = outer.wrote = True
+
+
+class ReplicaRouter:
+    def __init__(self):
+        self._turn = itertools.count()
+
+    def db_for_read(self, model, **hints):
+        pin = _pinned.get()
+        if (model._meta.app_label not in ROUTED_APPS or (pin is not None and pin.pinned)
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        replicas = settings.BLOG_READ_REPLICAS
+        start = next(self._turn)
+        for offset in range(len(replicas)):
+            alias = replicas[(start + offset) % len(replicas)]
+            if healthy(alias, pin):
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        pin = _pinned.get()
+        if pin is not None and model._meta.app_label in ROUTED_APPS:
+            pin.pinned = pin.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return False if db in settings.BLOG_READ_REPLICAS else None
+
+
+def client_key(request):
+    credentials = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if credentials:
+        return PIN_KEY.format(hashlib.sha256(credentials.encode()).hexdigest())
+    return None
+
+
+class ReplicaPinMiddleware:
+    """Read-your-writes for ReplicaRouter: pins a client to the primary for a while after it writes."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'BLOG_READ_REPLICAS', None):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        key = client_key(request)
+        pin = Pin(request.method not in SAFE_METHODS or (key is not None and get_cache().get(key) is not None))
+        token = _pinned.set(pin)
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        if pin.wrote and key is not None:
+            get_cache().set(key, 1, settings.BLOG_REPLICA_STICKY_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        key = client_key(request)
+        pin = Pin(request.method not in SAFE_METHODS or (key is not None and await get_cache().aget(key) is not None))
+        token = _pinned.set(pin)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        if pin.wrote and key is not None:
+            await get_cache().aset(key, 1, settings.BLOG_REPLICA_STICKY_SECONDS)
+        return response
@@ -0,0 +1,139 @@
+"""
+Full-text search over posts and comments.
+
+On PostgreSQL each model keeps a weighted `search_vector` column, filled by a
+trigger on write and indexed with GIN. On SQLite an external-content FTS5 table
+mirrors the text columns through triggers and is ranked with bm25(). Both are
+installed after `migrate`, so bulk inserts and plain UPDATEs stay indexed too.
+Installing also indexes the rows written before the triggers existed. Other
+databases get an unranked, unindexed `icontains` match, newest first.
+"""
+import re
+from functools import reduce
+from operator import or_
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, Q
+
+from .models import Comment, Post
+
+# Columns in weight order: the first one ranks highest.
+SEARCH_COLUMNS = {
+    Post: ('title', 'content'),
+    Comment: ('text',),
+}
+WEIGHTS = ('A', 'B', 'C', 'D')
+BM25_WEIGHTS = (10.0, 1.0, 1.0, 1.0)
+CONFIG = 'english'
+
+
+def _postgres_vector(columns, row=''):
+    return ' || '.join(
+        f"setweight(to_tsvector('{CONFIG}', coalesce({row}{column}, '')), '{weight}')"
+        for column, weight in zip(columns, WEIGHTS)
+    )
+
+
+def _postgres_ddl(table, columns):
+    vector = _postgres_vector(columns, 'NEW.')
+    return [
+        f"""CREATE OR REPLACE FUNCTION {table}_search_vector() RETURNS trigger AS $$
+            BEGIN NEW.search_vector := {vector}; RETURN NEW; END
+            $$ LANGUAGE plpgsql""",
+        f"DROP TRIGGER IF EXISTS {table}_search_vector ON {table}",
+        f"""CREATE TRIGGER {table}_search_vector BEFORE INSERT OR UPDATE OF {', '.join(columns)} ON {table}
+            FOR EACH ROW EXECUTE FUNCTION {table}_search_vector()""",
+        f"CREATE INDEX IF NOT EXISTS {table}_search_idx ON {table} USING gin (search_vector)",
+        # Picks up rows written before the trigger existed.
+        f"UPDATE {table} SET search_vector = {_postgres_vector(columns)} WHERE search_vector IS NULL",
+    ]
+
+
+def _sqlite_ddl(table, columns):
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    delete = f"INSERT INTO {table}_fts({table}_fts, rowid, {names}) VALUES ('delete', old.id, {old});"
+    insert = f"INSERT INTO {table}_fts(rowid, {names}) VALUES (new.id, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5({names}, content='{table}', content_rowid='id')",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE OF {names} ON {table} BEGIN {delete} {insert} END",
+        # Picks up rows written before the index existed.
+        f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')",
+    ]
+
+
+def install(using='default'):
+    """Creates the search triggers and indexes. Idempotent; run from post_migrate."""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        ddl = _postgres_ddl
+    elif connection.vendor == 'sqlite':
+        ddl = _sqlite_ddl
+    else:
+        return
+    with connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+        for model, columns in SEARCH_COLUMNS.items():
+            # The app has no migrations, so a plain `migrate` leaves its tables to `--run-syncdb`.
+            if model._meta.db_table not in tables:
+                continue
+            for statement in ddl(model._meta.db_table, columns):
+                cursor.execute(statement)
+
+
+def _fts5_query(text):
+    # Quote every word so user input can never be parsed as FTS5 syntax.
+    return ' '.join(f'"{word}"' for word in re.findall(r'\w+', text))
+
+
+def search(model, text, limit, offset=0, using='default'):
+    """The `limit` best matches for `text` from `offset`, best first."""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(text, search_type='websearch', config=CONFIG)
+        queryset = (model.objects.using(using).defer('search_vector').filter(search_vector=query)
+                    .annotate(rank=SearchRank(F('search_vector'), query))
+                    .order_by('-rank', '-id'))
+        return list(queryset[offset:offset + limit])
+
+    if connection.vendor != 'sqlite':
+        return _contains(model, text, limit, offset, using)
+    query = _fts5_query(text)
+    if not query:
+        return []
+    table = model._meta.db_table
+    weights = ', '.join(map(str, BM25_WEIGHTS[:len(SEARCH_COLUMNS[model])]))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH %s "
+            f"ORDER BY bm25({table}_fts, {weights}), rowid DESC LIMIT %s OFFSET %s",
+            [query, limit, offset],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+    objects = model.objects.using(using).defer('search_vector').in_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
+
+
+def _contains(model, text, limit, offset, using):
+    """Rows with every word of `text` in one of their search columns, newest first."""
+    words = re.findall(r'\w+', text)
+    if not words:
+        return []
+    queryset = model.objects.using(using).defer('search_vector')
+    for word in words:
+        queryset = queryset.filter(reduce(or_, (Q(**{f'{column}__icontains': word})
+                                                for column in SEARCH_COLUMNS[model])))
+    return list(queryset.order_by('-id')[offset:offset + limit])
+
+
+def search_page(model, text, page, limit, using='default'):
+    """
+    `(items, has_next)` for 1-based `page`. Results are ordered by rank, which
+    has no stable seek key, so pages are offsets into the ranked matches.
+    """
+    items = search(model, text, limit + 1, (page - 1) * limit, using)
+    return items[:limit], len(items) > limit
@@ -1,17 +1,59 @@
 from rest_framework import serializers
-from .models import Post, Comment
+from .models import POST_SUMMARY_FIELDS, Post, Comment
 
 class PostSerializer(serializers.ModelSerializer):
+    def __init__(self, *args, fields=None, **kwargs):
+        # `fields`: serialize only these, for sparse fieldsets.
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     class Meta:
         model = Post
-        fields = '__all__'
+        exclude = ['search_vector']
 
 class CommentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
-        fields = '__all__'
+        exclude = ['search_vector', 'ticket', 'created_at']
+
+class PostSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Post
+        fields = POST_SUMMARY_FIELDS
+
+class CommentWithPostSerializer(CommentSerializer):
+    post = PostSummarySerializer(read_only=True)
 
 class PostUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Post
-        fields = ['title', 'content']
\ No newline at end of file
+        fields = ['title', 'content']
+
+class PostBulkUpdateSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField()
+
+    class Meta:
+        model = Post
+        fields = ['id', 'title', 'content']
+        extra_kwargs = {'title': {'required': False}, 'content': {'required': False}}
+
+class PostBulkDeleteSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+
+class CommentBulkSerializer(serializers.ModelSerializer):
+    # A plain integer, so the batch checks every post in one query instead of one per item.
+    post_id = serializers.IntegerField()
+
+    class Meta:
+        model = Comment
+        fields = ['post_id', 'text', 'email']
+
+class CommentQueueSerializer(serializers.ModelSerializer):
+    # Validated without touching the database; the flusher drops comments on missing posts.
+    post = serializers.IntegerField()
+
+    class Meta:
+        model = Comment
+        fields = ['post', 'text', 'email']
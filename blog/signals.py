@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from rest_framework.authtoken.models import Token
+
+from .cache import invalidate_post, invalidate_posts
+from . import auth, feed, metrics, push, search
+from .models import Post
+
+# Sent with `post_ids` when posts change through queryset methods that bypass
+# post_save: comment_count updates, bulk_create and bulk_update.
+posts_changed = Signal()
+# Sent with `comments` by Comment.save and Comment.objects.bulk_create for new comments.
+comments_created = Signal()
+
+
+def invalidate(func, *args):
+    # Once now, and once more on commit so a reader racing the transaction
+    # cannot leave a pre-commit copy behind under the new version.
+    func(*args)
+    transaction.on_commit(lambda: func(*args))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, instance, **kwargs):
+    invalidate(invalidate_post, instance.pk)
+
+
+@receiver(posts_changed)
+def posts_updated(sender, post_ids, **kwargs):
+    invalidate(invalidate_posts, post_ids)
+
+
+# The feed entry of a deleted post goes with it, by cascade.
+@receiver(post_save, sender=Post)
+def refresh_feed_entry(sender, instance, **kwargs):
+    feed.refresh([instance.pk])
+
+
+@receiver(posts_changed)
+def refresh_feed_entries(sender, post_ids, **kwargs):
+    if post_ids:
+        feed.refresh(post_ids)
+
+
+@receiver(comments_created)
+def push_comments(sender, comments, **kwargs):
+    # Rendered now, published only once the comments are visible to readers.
+    events = [(comment.post_id, push.render_event(comment)) for comment in comments]
+    # Robust: the comments are already committed, whatever happens to their events.
+    transaction.on_commit(lambda: push.publish(events), robust=True)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, **kwargs):
+    invalidate(auth.forget_user, instance.pk)
+
+
+@receiver(user_logged_out)
+def forget_logged_out_user(sender, request, user, **kwargs):
+    if user is not None:
+        auth.forget_user(user.pk)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate(auth.forget_token, instance.key)
+
+
+def install_search(sender, using, **kwargs):
+    search.install(using)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    metrics.install(connection)
@@ -1,7 +1,40 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+import brotli
+import redis
+import zstandard
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.db.utils import load_backend
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from .auth import user_key
+from .bench import percentile, regressions
+from .compression import Brotli, Gzip, Zstd, compressible, negotiate
+from .management.commands.seed_db import generate_batch
+from .fieldsets import POST_FIELDS
+from .metrics import registry
+from .pool import ConnectionPool, PoolTimeout, ping
+from .push import OVERFLOW, RETRY, CommentStream, broker
+from . import auth, ratelimit, routers
+from .renderers import NinjaORJSONRenderer, ORJSONRenderer
+from .writebehind import flush, get_queue
 from .factories import CommentFactory, PostFactory
-from .models import Comment, Post
+from .models import EXCERPT_LENGTH, ArchivedComment, Comment, FeedEntry, Post
 from .serializers import CommentSerializer, PostSerializer, PostUpdateSerializer
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import User
@@ -12,11 +45,29 @@ class PostModelTestCase(TestCase):
         post = PostFactory()
         self.assertIsInstance(post, Post)
 
+    def test_save_keeps_comment_count(self):
+        post = Post.objects.get(pk=PostFactory().pk)
+        CommentFactory(post=post)
+        post.title = 'New title'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual((post.title, post.comment_count), ('New title', 1))
+
 class CommentModelTestCase(TestCase):
     def test_comment_creation(self):
         comment = CommentFactory()
         self.assertIsInstance(comment, Comment)
 
+    def test_moving_a_comment_moves_its_count(self):
+        first, second = PostFactory.create_batch(2)
+        comment = CommentFactory(post=first)
+        comment.post = second
+        comment.save()
+        comment.text = 'Edited'
+        comment.save()
+        counts = dict(Post.objects.values_list('id', 'comment_count'))
+        self.assertEqual((counts[first.id], counts[second.id]), (0, 1))
+
 class SerializerTestCase(TestCase):
     def setUp(self):
         self.post_data = {'title': 'Test Post', 'content': 'This is a test post.'}
@@ -55,9 +106,9 @@ class PostViewTestCase(TestCase):
     def test_post_list(self):
         response = self.client.get('/api/posts/')
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['title'], self.post_data['title'])
-        self.assertEqual(response.data[0]['content'], self.post_data['content'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['title'], self.post_data['title'])
+        self.assertEqual(response.data['results'][0]['content'], self.post_data['content'])
     
     def test_post_detail(self):
         response = self.client.get(f'/api/posts/{self.post.id}/')
@@ -91,10 +142,10 @@ class CommentViewTestCase(TestCase):
     def test_comment_list(self):
         response = self.client.get('/api/comments/')
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['post'], self.post.id)
-        self.assertEqual(response.data[0]['text'], self.comment_data['text'])
-        self.assertEqual(response.data[0]['email'], self.comment_data['email'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['post'], self.post.id)
+        self.assertEqual(response.data['results'][0]['text'], self.comment_data['text'])
+        self.assertEqual(response.data['results'][0]['email'], self.comment_data['email'])
     
     def test_comment_create(self):
         response = self.client.post('/api/comments/create/', data=self.comment_data)
@@ -116,9 +167,9 @@ class PostViewSetTestCase(TestCase):
     def test_post_list(self):
         response = self.client.get('/api/articles/')
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['title'], self.post_data['title'])
-        self.assertEqual(response.data[0]['content'], self.post_data['content'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['title'], self.post_data['title'])
+        self.assertEqual(response.data['results'][0]['content'], self.post_data['content'])
 
     def test_post_detail(self):
         response = self.client.get(f'/api/articles/{self.post.id}/')
@@ -138,8 +189,1487 @@ class PostViewSetTestCase(TestCase):
         response = self.client.put(f'/api/articles/{self.post.id}/', data=self.post_data)
         self.assertEqual(response.status_code, 200)
 
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        self.posts = PostFactory.create_batch(5)
+        self.comments = CommentFactory.create_batch(5, post=self.posts[0])
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def walk(self, url, key='results'):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            ids += [item['id'] for item in data[key]]
+            url, pages = data['next'], pages + 1
+        return ids, pages
+
+    def test_post_pages_newest_first(self):
+        ids, pages = self.walk('/api/posts/?limit=2')
+        self.assertEqual(ids, [post.id for post in reversed(self.posts)])
+        self.assertEqual(pages, 3)
+
+    def test_viewset_pages(self):
+        ids, pages = self.walk('/api/articles/?limit=3')
+        self.assertEqual(ids, [post.id for post in reversed(self.posts)])
+        self.assertEqual(pages, 2)
+
+    def test_comment_pages_by_id(self):
+        ids, pages = self.walk('/api/comments/?limit=2')
+        self.assertEqual(ids, [comment.id for comment in self.comments])
+        self.assertEqual(pages, 3)
+
+    def test_limit_is_capped(self):
+        with self.settings(BLOG_MAX_PAGE_SIZE=2):
+            response = self.client.get('/api/posts/?limit=50')
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/posts/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_ninja_post_pages(self):
+        self.client.force_login(self.user)
+        ids, pages = self.walk('/api/ninja/posts?limit=2')
+        self.assertEqual(ids, [post.id for post in reversed(self.posts)])
+        self.assertEqual(pages, 3)
+
+    def test_ninja_comment_pages(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/api/ninja/comments?limit=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 3)
+        response = self.client.get(response.json()['next'])
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertIsNone(response.json()['next'])
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.posts = PostFactory.create_batch(3)
+        CommentFactory.create_batch(2, post=self.posts[0])
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_post_export_ndjson(self):
+        body = self.read(self.client.get('/api/posts/export/'))
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [post.id for post in self.posts])
+        self.assertEqual(rows[0]['title'], self.posts[0].title)
+
+    def test_comment_export_json_array(self):
+        response = self.client.get('/api/comments/export/?output=json')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        rows = json.loads(self.read(response))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['post_id'], self.posts[0].id)
+
+    def test_empty_json_array(self):
+        Comment.objects.all().delete()
+        self.assertEqual(json.loads(self.read(self.client.get('/api/comments/export/?output=json'))), [])
+
+    def test_invalid_output(self):
+        response = self.client.get('/api/posts/export/?output=xml')
+        self.assertEqual(response.status_code, 400)
+
+    def test_ninja_export(self):
+        self.client.force_login(self.user)
+        body = self.read(self.client.get('/api/ninja/posts/export?output=json'))
+        self.assertEqual(len(json.loads(body)), 3)
+        body = self.read(self.client.get('/api/ninja/comments/export'))
+        self.assertEqual(len(body.splitlines()), 2)
+
+    def archive_first_comment(self):
+        comment = Comment.objects.order_by('id').first()
+        ArchivedComment.objects.create(id=comment.id, post_id=comment.post_id, text=comment.text,
+                                       email=comment.email, created_at=comment.created_at)
+        Comment.objects.filter(pk=comment.pk).delete(update_counts=False)
+        return sorted(Comment.objects.values_list('id', flat=True)) + [comment.id]
+
+    def test_comment_export_includes_archived(self):
+        ids = sorted(self.archive_first_comment())
+        body = self.read(self.client.get('/api/comments/export/'))
+        self.assertEqual([json.loads(line)['id'] for line in body.splitlines()], ids)
+        self.client.force_login(self.user)
+        body = self.read(self.client.get('/api/ninja/comments/export?output=json'))
+        self.assertEqual([row['id'] for row in json.loads(body)], ids)
+
+    async def test_asgi_export_streams_async(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        with override_settings(BLOG_EXPORT_CHUNK_SIZE=1):
+            response = await client.get('/api/posts/export/?output=json')
+            self.assertTrue(response.is_async)
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual([row['id'] for row in json.loads(body)], [post.id for post in self.posts])
+        ids = sorted(await sync_to_async(self.archive_first_comment)())
+        response = await client.get('/api/comments/export/')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual([json.loads(line)['id'] for line in body.splitlines()], ids)
+
+class PostCommentsTestCase(TestCase):
+    def setUp(self):
+        self.post, self.other = PostFactory.create_batch(2)
+        self.comments = CommentFactory.create_batch(3, post=self.post)
+        CommentFactory(post=self.other)
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_post_comment_list(self):
+        response = self.client.get(f'/api/posts/{self.post.id}/comments/?limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c['id'] for c in response.data['results']], [c.id for c in self.comments[:2]])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([c['id'] for c in response.data['results']], [self.comments[2].id])
+
+    def test_post_comment_list_missing_post(self):
+        response = self.client.get('/api/posts/999999/comments/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_ninja_post_comment_list(self):
+        self.client.force_login(self.user)
+        response = self.client.get(f'/api/ninja/posts/{self.other.id}/comments')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertEqual(response.json()['results'][0]['post_id'], self.other.id)
+
+    def test_comment_count_follows_creates_and_deletes(self):
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 3)
+        self.comments[0].delete()
+        Comment.objects.bulk_create([
+            Comment(post=self.post, text='a', email='a@example.com'),
+            Comment(post=self.other, text='b', email='b@example.com'),
+        ])
+        Comment.objects.filter(post=self.other).delete()
+        self.post.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 3)
+        self.assertEqual(self.other.comment_count, 0)
+
+    def test_comment_count_via_api(self):
+        self.client.post('/api/comments/create/', data={'post': self.post.id, 'text': 'x', 'email': 'x@example.com'})
+        self.client.force_login(self.user)
+        self.client.post('/api/ninja/comments', data={'post_id': self.post.id, 'text': 'y', 'email': 'y@example.com'},
+                         format='json')
+        response = self.client.get(f'/api/posts/{self.post.id}/')
+        self.assertEqual(response.data['comment_count'], 5)
+
+    def test_comment_count_is_read_only(self):
+        response = self.client.put(f'/api/articles/{self.post.id}/',
+                                   data={'title': 't', 'content': 'c', 'comment_count': 100})
+        self.assertEqual(response.status_code, 200)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 3)
+
+class PostCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.post = PostFactory()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def post_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [q['sql'] for q in queries if 'blog_post' in q['sql']]
+
+    def test_detail_hit_skips_database(self):
+        _, first = self.post_queries(f'/api/posts/{self.post.id}/')
+        self.assertTrue(first)
+        for url in (f'/api/posts/{self.post.id}/', f'/api/articles/{self.post.id}/'):
+            response, queries = self.post_queries(url)
+            self.assertEqual(queries, [])
+            self.assertEqual(response.data['title'], self.post.title)
+
+    def test_first_list_page_is_cached(self):
+        self.post_queries('/api/posts/')
+        response, queries = self.post_queries('/api/posts/')
+        self.assertEqual(queries, [])
+        self.assertEqual(response.data['results'][0]['id'], self.post.id)
+
+    def test_update_invalidates(self):
+        self.client.get(f'/api/posts/{self.post.id}/')
+        self.client.get('/api/posts/')
+        self.client.put(f'/api/posts/{self.post.id}/update/', data={'title': 'New', 'content': 'Body'})
+        self.assertEqual(self.client.get(f'/api/posts/{self.post.id}/').data['title'], 'New')
+        self.assertEqual(self.client.get('/api/posts/').data['results'][0]['title'], 'New')
+
+    def test_comment_invalidates_count(self):
+        self.client.get(f'/api/posts/{self.post.id}/')
+        CommentFactory(post=self.post)
+        self.assertEqual(self.client.get(f'/api/posts/{self.post.id}/').data['comment_count'], 1)
+
+    def test_ninja_detail_and_delete(self):
+        self.client.force_login(self.user)
+        url = f'/api/ninja/posts/{self.post.id}'
+        self.post_queries(url)
+        response, queries = self.post_queries(url)
+        self.assertEqual(queries, [])
+        self.assertEqual(response.json()['title'], self.post.title)
+        self.client.delete(url)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_ninja_list_create_invalidates(self):
+        self.client.force_login(self.user)
+        self.assertEqual(len(self.client.get('/api/ninja/posts').json()['results']), 1)
+        self.client.post('/api/ninja/posts', data={'title': 'Another', 'content': 'Post'}, format='json')
+        self.assertEqual(len(self.client.get('/api/ninja/posts').json()['results']), 2)
+
+    def test_stats(self):
+        self.client.get(f'/api/posts/{self.post.id}/')
+        self.client.get(f'/api/posts/{self.post.id}/')
+        response = self.client.get('/api/cache/stats/')
+        # one lookup for the conditional GET validators and one for the body, per request
+        self.assertEqual(response.data['hits'], 2)
+        self.assertEqual(response.data['misses'], 2)
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.post = PostFactory()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.client.force_login(self.user)
+
+    def assertRevalidates(self, url, change):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        # Comment counts and deletes do not move updated_at, so no Last-Modified to go stale.
+        self.assertFalse(response.has_header('Last-Modified'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def edit(self):
+        self.post.title = 'Edited'
+        self.post.save()
+
+    def test_drf_detail(self):
+        self.assertRevalidates(f'/api/posts/{self.post.id}/', self.edit)
+
+    def test_viewset_detail_comment_changes_etag(self):
+        self.assertRevalidates(f'/api/articles/{self.post.id}/', lambda: CommentFactory(post=self.post))
+
+    def test_drf_list_delete_changes_etag(self):
+        PostFactory()
+        self.assertRevalidates('/api/posts/', self.post.delete)
+
+    def test_viewset_list(self):
+        self.assertRevalidates('/api/articles/', PostFactory)
+
+    def test_ninja_detail(self):
+        self.assertRevalidates(f'/api/ninja/posts/{self.post.id}', self.edit)
+
+    def test_ninja_list(self):
+        self.assertRevalidates('/api/ninja/posts', self.edit)
+
+    def test_not_modified_skips_serialization(self):
+        etag = self.client.get(f'/api/posts/{self.post.id}/')['ETag']
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'/api/posts/{self.post.id}/', HTTP_IF_NONE_MATCH=etag)
+        post_queries = [q['sql'] for q in queries if 'blog_post' in q['sql']]
+        self.assertEqual(len(post_queries), 1)
+        self.assertNotIn('"content"', post_queries[0])
+
+class BulkWriteTestCase(TestCase):
+    def setUp(self):
+        self.post = PostFactory()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def comments(self, n, post_id=None):
+        return [{'post_id': post_id or self.post.id, 'text': f'Comment {i}', 'email': f'user{i}@example.com'}
+                for i in range(n)]
+
+    def test_comment_bulk_create(self):
+        self.client.get('/api/comments/')  # Caches the token.
+        counts = []
+        for size in (5, 50):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post('/api/comments/bulk/', data=self.comments(size), format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.data['created']), size)
+            self.assertEqual(response.data['errors'], [])
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 55)
+
+    def test_comment_bulk_partial_errors(self):
+        items = self.comments(3)
+        items[1]['email'] = 'not-an-email'
+        items[2]['post_id'] = 999999
+        response = self.client.post('/api/comments/bulk/', data=items, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([item['index'] for item in response.data['created']], [0])
+        self.assertEqual([item['index'] for item in response.data['errors']], [1, 2])
+        self.assertIn('email', response.data['errors'][0]['errors'])
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_batch_size_limit(self):
+        with self.settings(BLOG_BULK_MAX_BATCH=2):
+            response = self.client.post('/api/comments/bulk/', data=self.comments(3), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Comment.objects.count(), 0)
+
+    def test_post_bulk_create_and_update(self):
+        response = self.client.post('/api/posts/bulk/', format='json',
+                                    data=[{'title': 'A', 'content': 'a'}, {'title': 'B'}])
+        self.assertEqual(response.status_code, 207)
+        created_id = response.data['created'][0]['id']
+        response = self.client.put('/api/posts/bulk/', format='json',
+                                   data=[{'id': created_id, 'title': 'A2'}, {'id': self.post.id, 'content': 'new'}])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Post.objects.get(id=created_id).title, 'A2')
+        self.assertEqual(Post.objects.get(id=self.post.id).content, 'new')
+
+    def test_ninja_bulk(self):
+        self.client.force_login(self.user)
+        items = self.comments(3)
+        del items[0]['text']
+        response = self.client.post('/api/ninja/comments/bulk', data=items, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(len(response.json()['created']), 2)
+        self.assertEqual(response.json()['errors'][0]['index'], 0)
+        response = self.client.post('/api/ninja/posts/bulk', data=[{'title': 'A', 'content': 'a'}], format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.put('/api/ninja/posts/bulk', data=[{'id': 999999, 'title': 'x'}], format='json')
+        self.assertEqual(response.status_code, 207)
+        with self.settings(BLOG_BULK_MAX_BATCH=2):
+            response = self.client.post('/api/ninja/comments/bulk', data=self.comments(3), format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_post_bulk_delete(self):
+        other = Post.objects.create(title='Other', content='Other content')
+        response = self.client.delete('/api/posts/bulk/', format='json',
+                                      data=[{'id': other.id}, {'id': 999999}, {'id': other.id}])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['created'], [{'index': 0, 'id': other.id}])
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertFalse(Post.objects.filter(id=other.id).exists())
+
+        self.client.force_login(self.user)
+        response = self.client.delete('/api/ninja/posts/bulk', data=[{'id': self.post.id}], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(Post.objects.filter(id=self.post.id).exists())
+
+    def test_post_bulk_rejects_duplicates_and_long_titles(self):
+        response = self.client.put('/api/posts/bulk/', format='json',
+                                   data=[{'id': self.post.id, 'title': 'A'}, {'id': self.post.id, 'title': 'B'}])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['errors'][0]['errors'], {'id': ['Duplicate id in batch.']})
+        self.assertEqual(Post.objects.get(id=self.post.id).title, 'A')
+
+        self.client.force_login(self.user)
+        response = self.client.post('/api/ninja/posts/bulk', format='json',
+                                    data=[{'title': 'x' * 201, 'content': 'a'}, {'title': 'B', 'content': 'b'}])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()['errors'][0]['index'], 0)
+        response = self.client.put('/api/ninja/posts/bulk', format='json',
+                                   data=[{'id': self.post.id, 'title': 'x' * 201}])
+        self.assertEqual(response.status_code, 207)
+
+    def test_bulk_create_invalidates_list_cache(self):
+        cache.clear()
+        self.client.get('/api/posts/')
+        self.client.post('/api/posts/bulk/', data=[{'title': 'A', 'content': 'a'}], format='json')
+        self.assertEqual(len(self.client.get('/api/posts/').data['results']), 2)
+
+class AsyncNinjaTestCase(TestCase):
+    def setUp(self):
+        self.posts = PostFactory.create_batch(3)
+        self.comments = CommentFactory.create_batch(2, post=self.posts[0])
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+
+    async def login(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        return client
+
+    async def test_requires_login(self):
+        response = await AsyncClient().get('/api/ninja-async/posts')
+        self.assertEqual(response.status_code, 302)
+
+    async def test_list_posts_pages(self):
+        client = await self.login()
+        response = await client.get('/api/ninja-async/posts?limit=2')
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertEqual(response.status_code, 200)
+        page = response.json()
+        self.assertEqual([p['id'] for p in page['results']], [self.posts[2].id, self.posts[1].id])
+        page = (await client.get(page['next'])).json()
+        self.assertEqual([p['id'] for p in page['results']], [self.posts[0].id])
+        self.assertIsNone(page['next'])
+
+    async def test_comments(self):
+        client = await self.login()
+        response = await client.get(f'/api/ninja-async/posts/{self.posts[0].id}/comments')
+        self.assertEqual([c['id'] for c in response.json()['results']], [c.id for c in self.comments])
+        response = await client.post('/api/ninja-async/comments', content_type='application/json',
+                                     data={'post_id': self.posts[1].id, 'text': 'Hi', 'email': 'a@example.com'})
+        self.assertEqual(response.status_code, 200)
+        response = await client.get('/api/ninja-async/comments')
+        self.assertEqual(len(response.json()['results']), 3)
+
+    async def test_post_lifecycle(self):
+        client = await self.login()
+        response = await client.post('/api/ninja-async/posts', content_type='application/json',
+                                     data={'title': 'Async', 'content': 'Post'})
+        post_id = response.json()['id']
+        await client.put(f'/api/ninja-async/posts/{post_id}', content_type='application/json', data={'title': 'Edited'})
+        response = await client.get(f'/api/ninja-async/posts/{post_id}')
+        self.assertEqual(response.json()['title'], 'Edited')
+        self.assertEqual(response.json()['content'], 'Post')
+        await client.delete(f'/api/ninja-async/posts/{post_id}')
+        response = await client.get(f'/api/ninja-async/posts/{post_id}')
+        self.assertEqual(response.status_code, 404)
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        self.title_match = Post.objects.create(title='Tuning Postgres indexes', content='Nothing else here.')
+        self.content_match = Post.objects.create(title='Weekly notes', content='We spent a day tuning our indexes.')
+        self.other = Post.objects.create(title='Gardening', content='Tomatoes and basil.')
+        self.comment = Comment.objects.create(post=self.other, text='Basil needs sun', email='a@example.com')
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.json()['results']]
+
+    def test_title_outranks_content(self):
+        ids = self.ids(self.client.get('/api/search/?q=tuning indexes'))
+        self.assertEqual(ids, [self.title_match.id, self.content_match.id])
+
+    def test_index_follows_writes(self):
+        self.title_match.title = 'Something else'
+        self.title_match.content = 'Unrelated'
+        self.title_match.save()
+        Post.objects.bulk_create([Post(title='Bulk tuning', content='x')])
+        self.content_match.delete()
+        ids = self.ids(self.client.get('/api/search/?q=tuning'))
+        self.assertEqual(ids, [Post.objects.get(title='Bulk tuning').id])
+
+    def test_comment_scope(self):
+        ids = self.ids(self.client.get('/api/search/?q=basil&scope=comments'))
+        self.assertEqual(ids, [self.comment.id])
+
+    def test_pages(self):
+        response = self.client.get('/api/search/?q=indexes&limit=1')
+        self.assertEqual(self.ids(response), [self.title_match.id])
+        self.assertEqual(self.ids(self.client.get(response.json()['next'])), [self.content_match.id])
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(self.ids(self.client.get('/api/search/?q="basil(*')), [self.other.id])
+
+    def test_missing_query(self):
+        self.assertEqual(self.client.get('/api/search/').status_code, 400)
+
+    def test_other_databases_match_words(self):
+        with mock.patch.object(connection, 'vendor', 'mysql'):
+            ids = self.ids(self.client.get('/api/search/?q=tuning indexes'))
+        self.assertEqual(ids, [self.content_match.id, self.title_match.id])
+
+    def test_ninja_search(self):
+        self.client.force_login(self.user)
+        ids = self.ids(self.client.get('/api/ninja/search?q=basil&scope=comments'))
+        self.assertEqual(ids, [self.comment.id])
+        ids = self.ids(self.client.get('/api/ninja/search?q=tuning'))
+        self.assertEqual(ids, [self.title_match.id, self.content_match.id])
+
+class BenchTestCase(TestCase):
+    def result(self, p95, queries):
+        summary = {'p95_ms': p95}
+        return {'endpoints': {'drf:post-list': {'queries': queries, 'sequential': summary, 'concurrent': summary}}}
+
+    def test_percentile(self):
+        self.assertEqual(percentile(list(range(1, 101)), 95), 95)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_regressions(self):
+        self.assertEqual(regressions(self.result(1.4, 2), self.result(1.0, 2), 1.5), [])
+        self.assertEqual(len(regressions(self.result(2.0, 2), self.result(1.0, 2), 1.5)), 2)
+        self.assertEqual(regressions(self.result(1.0, 3), self.result(1.0, 2), 1.5),
+                         ['drf:post-list: queries 2 -> 3'])
+
+    def test_new_errors_are_regressions(self):
+        failing = self.result(0.1, 2)
+        failing['endpoints']['drf:post-list']['concurrent'] = {'p95_ms': 0.1, 'errors': 50}
+        self.assertEqual(regressions(failing, self.result(1.0, 2), 1.5), ['drf:post-list: concurrent errors 0 -> 50'])
+
+
+class CommentQueryCountTestCase(TestCase):
+    def setUp(self):
+        posts = PostFactory.create_batch(50)
+        for post in posts:
+            CommentFactory(post=post)
+        self.user = User.objects.create_superuser(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def query_counts(self, url, sizes=(5, 50)):
+        self.client.get(url.format(limit=1))  # Caches the token or session user.
+        counts = []
+        for size in sizes:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url.format(limit=size))
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(queries)
+            counts.append(len(queries))
+        return response, counts
+
+    def test_drf_embedded_post(self):
+        for url in ('/api/comments/?expand=post&limit={limit}', '/api/comments/?limit={limit}'):
+            response, counts = self.query_counts(url)
+            self.assertEqual(counts[0], counts[1])
+            self.assertEqual(len(response.data['results']), 50)
+        response, _ = self.query_counts('/api/comments/?expand=post&limit={limit}', sizes=(1,))
+        comment = Comment.objects.select_related('post').get(id=response.data['results'][0]['id'])
+        self.assertEqual(response.data['results'][0]['post']['title'], comment.post.title)
+        self.assertEqual(set(response.data['results'][0]['post']), {'id', 'title', 'created_at'})
+
+    def test_ninja_embedded_post(self):
+        self.client.force_login(self.user)
+        response, counts = self.query_counts('/api/ninja/comments?expand=post&limit={limit}')
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(set(response.json()['results'][0]['post']), {'id', 'title', 'created_at'})
+        response, counts = self.query_counts('/api/ninja/comments?limit={limit}')
+        self.assertEqual(counts[0], counts[1])
+        self.assertIsNone(response.json()['results'][0]['post'])
+
+    def test_list_skips_search_vector(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/comments/')
+        self.assertTrue(queries)
+        self.assertFalse([q for q in queries if 'blog_comment' in q['sql'] and 'search_vector' in q['sql']])
+
+    def test_admin_changelist(self):
+        self.client.force_login(self.user)
+        self.client.get('/admin/blog/comment/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/blog/comment/')
+        self.assertEqual(response.status_code, 200)
+        Comment.objects.bulk_create([Comment(post=comment.post, text='More', email='a@example.com')
+                                     for comment in Comment.objects.select_related('post')])
+        with CaptureQueriesContext(connection) as more_queries:
+            self.client.get('/admin/blog/comment/')
+        self.assertEqual(len(queries), len(more_queries))
+
+    def test_str_does_not_query(self):
+        comment = Comment.objects.first()
+        with self.assertNumQueries(0):
+            self.assertEqual(str(comment), f'Comment by {comment.email} on post {comment.post_id}')
+
+
+class SparseFieldsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.posts = [Post.objects.create(title=f'Post {i}', content='word ' * 2000) for i in range(3)]
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_excerpt_computed_on_write(self):
+        post = self.posts[0]
+        self.assertLessEqual(len(post.excerpt), EXCERPT_LENGTH + 1)
+        self.assertTrue(post.excerpt.endswith('word…'))
+        post.content = '  Short\n\ncontent  '
+        post.save(update_fields=['content'])
+        self.assertEqual(Post.objects.get(pk=post.pk).excerpt, 'Short content')
+        created = Post.objects.bulk_create([Post(title='Bulk', content='Bulk content')])
+        self.assertEqual(Post.objects.get(pk=created[0].pk).excerpt, 'Bulk content')
+        created[0].content = 'Changed'
+        Post.objects.bulk_update(created, ['content'])
+        self.assertEqual(Post.objects.get(pk=created[0].pk).excerpt, 'Changed')
+
+    def test_backfill_excerpts(self):
+        # Rows written before the column existed have an empty excerpt.
+        Post.objects.filter(pk__in=[post.pk for post in self.posts]).update(excerpt='')
+        Post.objects.create(title='Empty', content='')
+        call_command('backfill_excerpts', batch_size=2, stdout=io.StringIO())
+        for post in self.posts:
+            self.assertEqual(Post.objects.get(pk=post.pk).excerpt, post.excerpt)
+
+    def test_drf_list_projects_columns(self):
+        full = self.client.get('/api/posts/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/posts/?fields=title,id,excerpt&limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([list(item) for item in response.data['results']], [['id', 'title', 'excerpt']] * 2)
+        post_queries = [q['sql'] for q in queries if 'FROM "blog_post"' in q['sql']]
+        self.assertTrue(post_queries)
+        self.assertFalse([sql for sql in post_queries if '"content"' in sql])
+        self.assertLess(len(response.content) * 10, len(full.content))
+        page = self.client.get(response.data['next']).data
+        self.assertEqual([item['id'] for item in page['results']], [self.posts[0].id])
+
+    def test_drf_detail_and_viewset(self):
+        response = self.client.get(f'/api/posts/{self.posts[0].id}/?fields=title')
+        self.assertEqual(response.data, {'title': 'Post 0'})
+        self.assertIn('content', self.client.get(f'/api/posts/{self.posts[0].id}/').data)
+        response = self.client.get('/api/articles/?fields=id')
+        self.assertEqual(response.data['results'], [{'id': post.id} for post in reversed(self.posts)])
+        response = self.client.put(f'/api/articles/{self.posts[0].id}/?fields=id',
+                                   {'title': 'Edited', 'content': 'Body'}, format='json')
+        self.assertEqual(response.data['excerpt'], 'Body')
+
+    def test_unknown_field(self):
+        response = self.client.get('/api/posts/?fields=title,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', str(response.data['fields']))
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/api/ninja/posts?fields=secret').status_code, 400)
+
+    def test_ninja(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/api/ninja/posts?fields=title&limit=2')
+        page = response.json()
+        self.assertEqual(page['results'], [{'title': 'Post 2'}, {'title': 'Post 1'}])
+        page = self.client.get(page['next']).json()
+        self.assertEqual(page, {'next': None, 'results': [{'title': 'Post 0'}]})
+        response = self.client.get(f'/api/ninja/posts/{self.posts[0].id}?fields=id,comment_count')
+        self.assertEqual(response.json(), {'id': self.posts[0].id, 'comment_count': 0})
+        self.assertEqual(set(self.client.get('/api/ninja/posts').json()['results'][0]),
+                         {'id', 'title', 'excerpt', 'content', 'comment_count', 'created_at', 'updated_at'})
+
+    async def test_async_ninja(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        page = (await client.get('/api/ninja-async/posts?fields=id&limit=1')).json()
+        self.assertEqual(page['results'], [{'id': self.posts[2].id}])
+        response = await client.get(f'/api/ninja-async/posts/{self.posts[0].id}?fields=excerpt')
+        self.assertEqual(list(response.json()), ['excerpt'])
+
+
+class FastJSONTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.posts = PostFactory.create_batch(3)
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_orjson_renderer_matches_json(self):
+        data = PostSerializer(Post.objects.all(), many=True).data
+        self.assertEqual(json.loads(ORJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+        post = Post.objects.values('id', 'created_at').first()
+        self.assertEqual(json.loads(NinjaORJSONRenderer().render(None, post, response_status=200))['id'], post['id'])
+
+    def test_drf_raw_list(self):
+        response = self.client.get('/api/posts/?raw=1&fields=id,title&limit=2')
+        self.assertEqual(response.status_code, 200)
+        page = response.json()
+        self.assertEqual(page['fields'], ['id', 'title'])
+        self.assertEqual(page['results'], [[post.id, post.title] for post in reversed(self.posts[1:])])
+        self.assertIn('ETag', response)
+        page = self.client.get(page['next']).json()
+        self.assertEqual(page, {'next': None, 'fields': ['id', 'title'], 'results': [[self.posts[0].id, self.posts[0].title]]})
+        self.assertEqual(self.client.get('/api/posts/?raw=1&cursor=bogus').status_code, 404)
+
+    def test_raw_list_skips_models(self):
+        page = self.client.get('/api/posts/?raw=1').json()
+        self.assertEqual(page['fields'], list(POST_FIELDS))
+        self.assertEqual(dict(zip(page['fields'], page['results'][0]))['content'], self.posts[2].content)
+
+    def test_ninja_raw_list(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/api/ninja/posts?raw=true&fields=title&limit=1')
+        self.assertIn('ETag', response)
+        page = response.json()
+        self.assertEqual(page['results'], [[self.posts[2].title]])
+        self.assertEqual(len(self.client.get(page['next']).json()['results']), 1)
+        response = self.client.get('/api/ninja/posts?raw=true', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class CachedAuthTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def auth_queries(self, url='/api/posts/', client=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = (client or self.client).get(url)
+        tables = ('"authtoken_token"', '"auth_user"', '"django_session"')
+        return response, [q['sql'] for q in queries if any(table in q['sql'] for table in tables)]
+
+    def test_token_cached(self):
+        response, first = self.auth_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(first)
+        response, second = self.auth_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(second, [])
+        self.assertNotIn(self.token.key, str(list(cache._cache)))
+
+    def test_token_deleted(self):
+        self.auth_queries()
+        self.token.delete()
+        self.assertEqual(self.client.get('/api/posts/').status_code, 403)
+
+    def test_user_deactivated(self):
+        self.auth_queries()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/posts/').status_code, 403)
+
+    def test_session_cached(self):
+        client = APIClient()
+        client.login(username='testuser', password='testpassword')
+        response, first = self.auth_queries('/api/ninja/posts', client)
+        self.assertEqual(response.status_code, 200)
+        response, second = self.auth_queries('/api/ninja/posts', client)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(second, [])
+
+    def test_password_hash_not_cached(self):
+        client = APIClient()
+        client.login(username='testuser', password='testpassword')
+        self.auth_queries('/api/ninja/posts', client)
+        self.auth_queries()
+        self.assertNotIn(self.user.password, repr(cache.get(user_key(self.user.pk))))
+        # Saving a user from the cache leaves the password alone.
+        user = User.objects.get(pk=self.user.pk)
+        cached = auth.cached_user(self.user.pk)
+        cached.first_name = 'Changed'
+        cached.save()
+        self.assertEqual(User.objects.get(pk=self.user.pk).password, user.password)
+        self.assertEqual(client.get('/api/ninja/posts').status_code, 200)
+
+    def test_logout(self):
+        client = APIClient()
+        client.login(username='testuser', password='testpassword')
+        self.auth_queries('/api/ninja/posts', client)
+        client.logout()
+        self.assertIsNone(cache.get(user_key(self.user.pk)))
+        self.assertEqual(client.get('/api/ninja/posts').status_code, 302)
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.posts = PostFactory.create_batch(3)
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def metrics(self):
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        return response.content.decode()
+
+    def test_records_per_route(self):
+        self.client.get('/api/posts/')
+        self.client.get(f'/api/posts/{self.posts[0].id}/')
+        self.client.get('/api/posts/')
+        text = self.metrics()
+        self.assertIn('# TYPE blog_request_duration_seconds histogram', text)
+        self.assertIn('blog_request_duration_seconds_count{route="post-list",method="GET"} 2', text)
+        self.assertIn('blog_request_duration_seconds_count{route="post-detail",method="GET"} 1', text)
+        self.assertIn('blog_db_queries_bucket{route="post-list",method="GET",le="+Inf"} 2', text)
+        self.assertIn('blog_serialization_duration_seconds_count{route="post-list",method="GET"} 2', text)
+
+    def test_counts_queries(self):
+        self.client.get('/api/comments/')
+        # The token lookup and the page of comments.
+        self.assertIn('blog_db_queries_sum{route="comment-list",method="GET"} 2.0', self.metrics())
+
+    def test_ninja_route(self):
+        self.client.force_login(self.user)
+        self.client.get('/api/ninja/posts')
+        text = self.metrics()
+        self.assertIn('blog_request_duration_seconds_count{route="api-1.0.0:list_posts",method="GET"} 1', text)
+        self.assertIn('blog_serialization_duration_seconds_count{route="api-1.0.0:list_posts",method="GET"} 1', text)
+
+    async def test_async_route(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        await client.get('/api/ninja-async/posts')
+        # The user (the session is cached) and the page of posts, both run by the async ORM's worker thread.
+        self.assertIn('blog_db_queries_sum{route="async_api:list_posts",method="GET"} 2.0', registry.render())
+
+    def test_slow_request_log(self):
+        with self.settings(BLOG_SLOW_REQUEST_MS=0.000001), self.assertLogs('blog.metrics') as logs:
+            self.client.get('/api/posts/')
+        self.assertIn('(post-list)', logs.output[0])
+        self.assertIn('FROM "blog_post"', logs.output[0])
+
+    def test_requires_login(self):
+        self.assertEqual(APIClient().get('/api/metrics/').status_code, 403)
+
+
+class SeedDbTestCase(TestCase):
+    def test_seeds_posts_with_comment_counts(self):
+        call_command('seed_db', posts=5, comments_per_post=3, batch_size=2, stdout=io.StringIO())
+        self.assertEqual(Post.objects.count(), 5)
+        self.assertEqual(Comment.objects.count(), 15)
+        self.assertEqual(set(Post.objects.values_list('comment_count', flat=True)), {3})
+
+    def test_same_seed_same_data(self):
+        self.assertEqual(generate_batch((1, 3, 2, 42)), generate_batch((1, 3, 2, 42)))
+        self.assertNotEqual(generate_batch((1, 3, 2, 42)), generate_batch((1, 3, 2, 43)))
+
+
+class WriteBehindTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(BLOG_WRITE_BEHIND=True, REDIS_URL=None,
+                                     BLOG_COMMENT_QUEUE_PATH=os.path.join(directory.name, 'queue.sqlite3'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.post = PostFactory()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def comment(self, post_id=None):
+        return {'post': post_id or self.post.id, 'text': 'Queued comment', 'email': 'test@example.com'}
+
+    def test_queued_and_flushed(self):
+        response = self.client.post('/api/comments/create/', data=self.comment())
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'queued')
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(flush(100), 1)
+        comment = Comment.objects.get()
+        self.assertEqual(str(comment.ticket), str(response.data['id']))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+    def test_ninja(self):
+        self.client.login(username='testuser', password='testpassword')
+        payload = {'post_id': self.post.id, 'text': 'Queued comment', 'email': 'test@example.com'}
+        response = self.client.post('/api/ninja/comments', data=payload, format='json')
+        self.assertEqual(response.status_code, 202)
+        call_command('flush_comments', once=True, stdout=io.StringIO())
+        self.assertEqual(str(Comment.objects.get().ticket), response.json()['id'])
+
+    def test_invalid_rejected_before_queueing(self):
+        response = self.client.post('/api/comments/create/', data={'post': self.post.id, 'text': 'x', 'email': 'nope'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(get_queue().size(), 0)
+
+    def test_redelivered_batch_not_duplicated(self):
+        self.client.post('/api/comments/create/', data=self.comment())
+        queue = get_queue()
+        # A flusher that wrote the batch but died before acknowledging it.
+        items = queue.claim(100, 'default')
+        Comment.objects.create(post=self.post, text=items[0]['text'], email=items[0]['email'], ticket=items[0]['ticket'])
+        queue.recover('default')
+        self.assertEqual(flush(100), 1)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual(queue.size(), 0)
+
+    def test_missing_post_dropped(self):
+        self.client.post('/api/comments/create/', data=self.comment(post_id=self.post.id + 1000))
+        with self.assertLogs('blog.writebehind', 'WARNING'):
+            self.assertEqual(flush(100), 1)
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(get_queue().size(), 0)
+
+    async def test_async_ninja(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        payload = {'post_id': self.post.id, 'text': 'Queued comment', 'email': 'test@example.com'}
+        response = await client.post('/api/ninja-async/comments', data=payload, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        with self.settings(BLOG_COMMENT_QUEUE_MAX=1):
+            response = await client.post('/api/ninja-async/comments', data=payload, content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(response['Retry-After'])
+        self.assertFalse(await Comment.objects.aexists())
+
+    @override_settings(BLOG_COMMENT_QUEUE_MAX=1)
+    def test_backpressure(self):
+        self.assertEqual(self.client.post('/api/comments/create/', data=self.comment()).status_code, 202)
+        response = self.client.post('/api/comments/create/', data=self.comment())
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(response['Retry-After'])
+
+
+class ConnectionPoolTestCase(TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def wrapper(self, alias, size=1, health_checks=False):
+        settings_dict = {**connection.settings_dict, 'ENGINE': 'blog.backends.sqlite3', 'NAME': self.path,
+                         'POOL': {'SIZE': size, 'TIMEOUT': 0.01}, 'CONN_HEALTH_CHECKS': health_checks}
+        wrapper = load_backend('blog.backends.sqlite3').DatabaseWrapper(settings_dict, alias)
+        self.addCleanup(wrapper.pool.close_idle)
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_reuses_connections(self):
+        wrapper = self.wrapper('pool_reuse')
+        for _ in range(3):
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            wrapper.close()
+        self.assertEqual(wrapper.pool.stats(), {'size': 1, 'open': 1, 'idle': 1, 'in_use': 0,
+                                                'waits': 0, 'timeouts': 0, 'connects': 1})
+
+    def test_timeout(self):
+        first, second = self.wrapper('pool_timeout'), self.wrapper('pool_timeout')
+        first.ensure_connection()
+        with self.assertRaises(OperationalError):
+            second.ensure_connection()
+        self.assertEqual(first.pool.stats()['timeouts'], 1)
+        first.close()
+        second.ensure_connection()
+        second.close()
+
+    def test_broken_connection_discarded(self):
+        class Broken:
+            def rollback(self):
+                raise RuntimeError
+
+            def close(self):
+                pass
+
+        pool = ConnectionPool(size=1, timeout=0.01)
+        pool.release(pool.acquire(Broken))
+        self.assertEqual(pool.stats()['open'], 0)
+        pool.acquire(Broken)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(Broken)
+        self.assertEqual(pool.stats()['waits'], 1)
+
+    def test_dead_idle_connection_replaced(self):
+        class Dead:
+            def rollback(self):
+                pass
+
+            def cursor(self):
+                raise RuntimeError('server closed the connection')
+
+            def close(self):
+                pass
+
+        pool = ConnectionPool(size=1, timeout=0.01, check_after=0.0)
+        dead = pool.acquire(Dead)
+        pool.release(dead)
+        fresh = pool.acquire(Dead, ping)
+        self.assertIsNot(fresh, dead)
+        self.assertEqual(pool.stats()['open'], 1)
+        pool.release(fresh)
+        # Recently released connections are handed out without a ping.
+        pool.check_after = 60.0
+        self.assertIs(pool.acquire(Dead, ping), fresh)
+
+    def test_health_checks_ping_every_checkout(self):
+        wrapper = self.wrapper('pool_health', health_checks=True)
+        with mock.patch('blog.pool.ping', wraps=ping) as pinged:
+            for _ in range(2):
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                wrapper.close()
+        self.assertEqual(pinged.call_count, 1)
+        self.assertEqual(wrapper.pool.stats()['connects'], 1)
+
+    def test_metrics(self):
+        self.wrapper('pool_metrics').ensure_connection()
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        client = APIClient()
+        client.force_authenticate(user)
+        body = client.get('/api/metrics/').content.decode()
+        self.assertIn('blog_db_pool_connections{alias="pool_metrics"', body)
+        self.assertIn('blog_db_pool_timeouts_total', body)
+
+
+class ServeTestCase(TestCase):
+    @mock.patch.dict(os.environ)
+    @mock.patch('blog.management.commands.serve.os.execvp')
+    def test_launches_gunicorn(self, execvp):
+        call_command('serve', asgi=True, workers=3, skip_collectstatic=True)
+        argv = execvp.call_args.args[1]
+        self.assertEqual(argv[1:3], ['-m', 'gunicorn'])
+        self.assertTrue(argv[4].endswith('gunicorn.conf.py'))
+        self.assertEqual(argv[5], 'config.asgi:application')
+        self.assertEqual((os.environ['SERVER_INTERFACE'], os.environ['WEB_CONCURRENCY']), ('asgi', '3'))
+
+
+@override_settings(DATABASE_ROUTERS=['blog.routers.ReplicaRouter'], BLOG_READ_REPLICAS=['replica'],
+                   BLOG_REPLICA_STICKY_SECONDS=5, BLOG_REPLICA_RETRY_SECONDS=30)
+class ReplicaRouterTestCase(TransactionTestCase):
+    # Not TestCase: reads inside its transaction would go to the primary.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        routers._down.clear()
+        self.post = PostFactory()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def queries(self, method, url, **kwargs):
+        with CaptureQueriesContext(connection) as primary, CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(self.client, method)(url, **kwargs)
+        tables = ('"blog_post"', '"blog_comment"')
+        return (response, [q['sql'] for q in primary if any(t in q['sql'] for t in tables)],
+                [q['sql'] for q in replica if any(t in q['sql'] for t in tables)])
+
+    def test_reads_go_to_replica(self):
+        # Not a post detail: cache fills read the primary.
+        response, primary, replica = self.queries('get', '/api/comments/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(primary, [])
+        self.assertTrue(replica)
+        self.assertEqual(Post.objects.all().db, 'replica')
+        self.assertEqual(User.objects.all().db, 'default')
+
+    def test_writer_pinned_to_primary(self):
+        data = {'title': 'Updated', 'content': 'Updated content'}
+        self.assertEqual(self.client.put(f'/api/posts/{self.post.id}/update/', data=data).status_code, 200)
+        response, primary, replica = self.queries('get', f'/api/posts/{self.post.id}/')
+        self.assertEqual(response.data['title'], 'Updated')
+        self.assertTrue(primary)
+        self.assertEqual(replica, [])
+        other = APIClient()
+        other.force_authenticate(self.user)
+        self.client = other
+        _, primary, replica = self.queries('get', '/api/comments/')
+        self.assertEqual(primary, [])
+
+    def test_unsafe_methods_read_the_primary(self):
+        data = {'title': 'Updated', 'content': 'Updated content'}
+        response, primary, replica = self.queries('put', f'/api/posts/{self.post.id}/update/', data=data)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any(q.startswith('SELECT') for q in primary))
+        self.assertEqual(replica, [])
+
+    def test_dead_open_connection_falls_back(self):
+        connections['replica'].ensure_connection()
+        pin = routers.Pin()
+        token = routers._pinned.set(pin)
+        self.addCleanup(routers._pinned.reset, token)
+        replica = connections['replica']
+        # The in-memory test database ignores close(), so reconnecting is made to fail instead.
+        with mock.patch.object(replica, 'is_usable', return_value=False) as is_usable, \
+                mock.patch.object(replica, 'close'), \
+                mock.patch.object(replica, 'ensure_connection', side_effect=OperationalError):
+            with self.assertLogs('blog.routers', 'WARNING'):
+                self.assertEqual(Post.objects.all().db, 'default')
+        is_usable.assert_called_once()
+        self.assertIn('replica', pin.checked)
+
+    def lagging_replica(self):
+        """A real second database: a snapshot of the primary that no later write reaches."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'replica.sqlite3')
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM INTO %s', [path])
+        connections.settings['lagging'] = {**connections.settings['replica'], 'NAME': path, 'TEST': {}}
+        self.addCleanup(connections.settings.pop, 'lagging')
+        self.addCleanup(connections.__delitem__, 'lagging')
+        self.addCleanup(lambda: connections['lagging'].close())
+        settings = override_settings(BLOG_READ_REPLICAS=['lagging'])
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_cache_fills_read_the_primary(self):
+        self.lagging_replica()
+        self.assertEqual(Post.objects.get(pk=self.post.pk).title, self.post.title)
+        self.assertEqual(Post.objects.all().db, 'lagging')
+        data = {'title': 'Updated', 'content': 'Updated content'}
+        self.assertEqual(self.client.put(f'/api/posts/{self.post.id}/update/', data=data).status_code, 200)
+        self.assertNotEqual(Post.objects.using('lagging').get(pk=self.post.pk).title, 'Updated')
+        other = APIClient()
+        other.force_authenticate(self.user)
+        # An unpinned client fills the cache first; the writer then reads that entry.
+        self.assertEqual(other.get(f'/api/posts/{self.post.id}/').data['title'], 'Updated')
+        self.assertEqual(self.client.get(f'/api/posts/{self.post.id}/').data['title'], 'Updated')
+
+    def test_unavailable_replica_falls_back(self):
+        with mock.patch.object(connections['replica'], 'ensure_connection', side_effect=OperationalError):
+            with self.assertLogs('blog.routers', 'WARNING'):
+                self.assertEqual(Post.objects.all().db, 'default')
+        # Skipped until the retry time, without trying to connect again.
+        self.assertEqual(Post.objects.all().db, 'default')
+        routers._down.clear()
+        self.assertEqual(Post.objects.all().db, 'replica')
+
+
+class FeedTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.posts = PostFactory.create_batch(3)
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def feed(self, url='/api/feed/'):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def expected(self):
+        posts = Post.objects.order_by('-created_at', '-id')
+        return [PostSerializer(post, fields=['id', 'title', 'excerpt', 'comment_count', 'created_at']).data
+                for post in posts]
+
+    def test_matches_posts(self):
+        self.client.post('/api/comments/create/', data={'post': self.posts[0].id, 'text': 'Hi', 'email': 'a@example.com'})
+        self.client.put(f'/api/posts/{self.posts[1].id}/update/', data={'title': 'Updated', 'content': 'New'})
+        self.client.post('/api/posts/bulk/', data=[{'title': 'Bulk', 'content': 'Bulk content'}], format='json')
+        self.posts[2].delete()
+        self.assertEqual(self.feed()['results'], self.expected())
+        self.assertEqual(FeedEntry.objects.count(), 3)
+
+    def test_comment_deleted(self):
+        comment = CommentFactory(post=self.posts[0])
+        self.assertEqual(self.feed()['results'], self.expected())
+        comment.delete()
+        self.assertEqual(self.feed()['results'], self.expected())
+
+    def test_pages(self):
+        page = self.feed('/api/feed/?limit=2')
+        self.assertEqual(len(page['results']), 2)
+        rest = self.client.get(page['next']).json()
+        self.assertIsNone(rest['next'])
+        self.assertEqual(page['results'] + rest['results'], self.expected())
+        self.assertEqual(self.client.get('/api/feed/?cursor=nope').status_code, 404)
+
+    def test_one_query(self):
+        self.feed()
+        with CaptureQueriesContext(connection) as queries:
+            self.feed()
+        self.assertEqual([q['sql'] for q in queries if 'blog_' in q['sql']], [
+            q['sql'] for q in queries if 'blog_feedentry' in q['sql']])
+        self.assertEqual(len([q for q in queries if 'blog_feedentry' in q['sql']]), 1)
+
+    def test_ninja(self):
+        self.client.login(username='testuser', password='testpassword')
+        expected = self.feed()
+        self.assertEqual(self.client.get('/api/ninja/feed').json(), expected)
+        self.assertEqual(self.client.get('/api/ninja-async/feed').json(), expected)
+
+    def test_rebuild(self):
+        FeedEntry.objects.all().delete()
+        Post.objects.filter(pk=self.posts[0].pk).update(title='Changed behind the ORM')
+        call_command('rebuild_feed', stdout=io.StringIO())
+        self.assertEqual(self.feed()['results'], self.expected())
+
+
+class CommentPushTestCase(TestCase):
+    def setUp(self):
+        self.post = PostFactory()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+
+    def create_comment(self):
+        # Published on commit, from the ORM's thread.
+        with self.captureOnCommitCallbacks(execute=True):
+            return Comment.objects.create(post=self.post, text='Hi', email='a@example.com')
+
+    async def stream(self, **headers):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        response = await client.get(f'/api/ninja-async/posts/{self.post.id}/comments/stream', headers=headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        # What the server does when the stream ends or the client goes away.
+        self.addCleanup(response.close)
+        events = aiter(response.streaming_content)
+        self.assertEqual(await anext(events), RETRY)
+        return response, events
+
+    async def test_new_comments_pushed(self):
+        response, events = await self.stream()
+        comment = await sync_to_async(self.create_comment)()
+        event = await asyncio.wait_for(anext(events), 1)
+        self.assertEqual(event.split(b'\n')[:2], [f'id: {comment.id}'.encode(), b'event: comment'])
+        self.assertEqual(json.loads(event.split(b'data: ')[1]), CommentSerializer(comment).data)
+        self.assertEqual(broker.count, 1)
+        response.close()
+        self.assertEqual(broker.count, 0)
+
+    async def test_missed_comments_replayed(self):
+        first, second = [await Comment.objects.acreate(post=self.post, text=text, email='a@example.com')
+                         for text in ('One', 'Two')]
+        _, events = await self.stream(last_event_id=str(first.id))
+        self.assertTrue((await anext(events)).startswith(f'id: {second.id}\n'.encode()))
+
+    @override_settings(BLOG_PUSH_BUFFER=2)
+    async def test_slow_consumer_disconnected(self):
+        events = aiter(CommentStream(self.post.id))
+        await anext(events)
+        for comment_id in range(1, 4):
+            broker.dispatch(self.post.id, b'id: %d\nevent: comment\ndata: {}\n\n' % comment_id)
+        self.assertEqual(await anext(events), OVERFLOW)
+        with self.assertRaises(StopAsyncIteration):
+            await anext(events)
+        self.assertEqual(broker.count, 0)
+
+    def test_redis_failure_does_not_fail_the_write(self):
+        client = mock.Mock()
+        client.pipeline.return_value.execute.side_effect = redis.ConnectionError('down')
+        with self.settings(REDIS_URL='redis://redis:6379/0'), \
+                mock.patch('blog.push._redis', return_value=client), self.assertLogs('blog.push', 'ERROR'):
+            comment = self.create_comment()
+        self.assertTrue(Comment.objects.filter(pk=comment.pk).exists())
+
+    def test_wsgi_rejected(self):
+        self.client.force_login(self.user)
+        response = self.client.get(f'/api/ninja-async/posts/{self.post.id}/comments/stream')
+        self.assertEqual(response.status_code, 501)
+        self.assertEqual(broker.count, 0)
+
+    @override_settings(BLOG_PUSH_MAX_SUBSCRIBERS=0)
+    async def test_subscriber_limit(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        response = await client.get(f'/api/ninja-async/posts/{self.post.id}/comments/stream')
+        self.assertEqual(response.status_code, 503)
+
+
+class CompressionTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        PostFactory.create_batch(5, content='Lorem ipsum dolor sit amet. ' * 20)
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_negotiation(self):
+        self.assertEqual(negotiate('gzip, br, zstd').name, 'zstd')
+        self.assertEqual(negotiate('gzip;q=1.0, br;q=0.5').name, 'gzip')
+        self.assertEqual(negotiate('zstd;q=0, *').name, 'br')
+        self.assertEqual(negotiate('deflate, gzip', [Gzip()]).name, 'gzip')
+        self.assertIsNone(negotiate(''))
+        self.assertIsNone(negotiate('identity, gzip;q=0, br;q=0, zstd;q=0'))
+
+    def test_post_list_compressed(self):
+        plain = self.client.get('/api/posts/')
+        for encoder, decompress in ((Gzip(), gzip.decompress), (Brotli(), brotli.decompress),
+                                    (Zstd(), zstandard.ZstdDecompressor().decompress)):
+            response = self.client.get('/api/posts/', HTTP_ACCEPT_ENCODING=encoder.name)
+            self.assertEqual(response['Content-Encoding'], encoder.name)
+            self.assertIn('Accept-Encoding', response['Vary'])
+            self.assertEqual(int(response['Content-Length']), len(response.content))
+            self.assertLess(len(response.content), len(plain.content))
+            self.assertEqual(decompress(response.content), plain.content)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+    def test_weak_etag_revalidates(self):
+        response = self.client.get('/api/posts/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        response = self.client.get('/api/posts/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_small_responses_sent_as_is(self):
+        with self.settings(BLOG_COMPRESS_MIN_SIZE=10 ** 6):
+            response = self.client.get('/api/posts/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_streaming_compressed(self):
+        plain = b''.join(self.client.get('/api/posts/export/').streaming_content)
+        response = self.client.get('/api/posts/export/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+
+    def test_event_streams_not_compressed(self):
+        self.assertFalse(compressible(StreamingHttpResponse(iter(()), content_type='text/event-stream')))
+        self.assertFalse(compressible(HttpResponse('<p></p>')))
+        self.assertTrue(compressible(HttpResponse('{}', content_type='application/json; charset=utf-8')))
+
+    @override_settings(BLOG_COMPRESS_CACHE=True)
+    def test_compressed_bodies_cached(self):
+        with mock.patch.object(Gzip, 'compress', autospec=True, side_effect=Gzip.compress) as compress:
+            first = self.client.get('/api/posts/', HTTP_ACCEPT_ENCODING='gzip')
+            second = self.client.get('/api/posts/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compress.call_count, 1)
+        self.assertEqual(first.content, second.content)
+        PostFactory(content='Lorem ipsum dolor sit amet. ' * 20)
+        third = self.client.get('/api/posts/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(third.content))['results']), 6)
+
+
+@override_settings(BLOG_RATELIMIT=True, BLOG_RATE_READ='2/min', BLOG_RATE_WRITE='1/min', BLOG_RATE_BULK='1/min')
+class RateLimitTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        # Until the auth cache knows a token, its requests count against their address.
+        self.client.get('/api/cache/stats/')
+        ratelimit.memory.clear()
+        self.addCleanup(ratelimit.memory.clear)
+
+    def assertThrottled(self, response):
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 60)
+
+    def test_drf_read_budget(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/posts/').status_code, 200)
+        self.assertThrottled(self.client.get('/api/posts/'))
+        # Other budgets and other users are untouched.
+        self.assertEqual(self.client.post('/api/posts/create/', {'title': 'T', 'content': 'C'}).status_code, 201)
+        self.assertEqual(self.client.get('/api/posts/export/').status_code, 200)
+        self.assertThrottled(self.client.get('/api/comments/export/'))
+        other = User.objects.create_user(username='other', password='testpassword')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=other).key)
+        self.assertEqual(self.client.get('/api/posts/').status_code, 200)
+
+    def test_bad_credentials_spend_the_address_budget(self):
+        client = APIClient()
+        for key in ('bad1', 'bad2'):
+            client.credentials(HTTP_AUTHORIZATION='Token ' + key)
+            self.assertEqual(client.get('/api/posts/').status_code, 403)
+        # A fresh unknown token is still the same address.
+        client.credentials(HTTP_AUTHORIZATION='Token bad3')
+        self.assertThrottled(client.get('/api/posts/'))
+        client.credentials()
+        self.assertThrottled(client.get('/api/ninja/posts'))
+        # Known tokens are their user's, wherever they come from.
+        self.assertEqual(self.client.get('/api/posts/').status_code, 200)
+
+    def test_both_stacks_key_addresses_alike(self):
+        client = APIClient()
+        with self.settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            for _ in range(2):
+                self.assertEqual(client.get('/api/posts/', HTTP_X_FORWARDED_FOR='203.0.113.5').status_code, 403)
+            self.assertThrottled(client.get('/api/ninja/posts', HTTP_X_FORWARDED_FOR='203.0.113.5'))
+            # Another client behind the same proxy has its own budget.
+            self.assertEqual(client.get('/api/ninja/posts', HTTP_X_FORWARDED_FOR='203.0.113.6').status_code, 302)
+
+    def test_ninja_shares_the_budget(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/api/posts/').status_code, 200)
+        self.assertEqual(self.client.get('/api/ninja/posts').status_code, 200)
+        response = self.client.get('/api/ninja/comments')
+        self.assertThrottled(response)
+        self.assertIn('throttled', response.json()['detail'])
+        self.assertEqual(self.client.post('/api/ninja/posts', {'title': 'T', 'content': 'C'},
+                                          format='json').status_code, 200)
+        self.assertThrottled(self.client.post('/api/ninja/posts', {'title': 'T', 'content': 'C'}, format='json'))
+
+    async def test_async_ninja(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        for _ in range(2):
+            self.assertEqual((await client.get('/api/ninja-async/posts')).status_code, 200)
+        self.assertThrottled(await client.get('/api/ninja-async/posts'))
+
+    def test_bucket_refills(self):
+        buckets = ratelimit.MemoryBuckets()
+        with mock.patch('blog.ratelimit.time.monotonic', return_value=100.0) as now:
+            self.assertIsNone(buckets.spend('k', 1.0, 2.0))
+            self.assertIsNone(buckets.spend('k', 1.0, 2.0))
+            self.assertAlmostEqual(buckets.spend('k', 1.0, 2.0), 1.0)
+            now.return_value = 101.0
+            self.assertIsNone(buckets.spend('k', 1.0, 2.0))
+            self.assertIsNotNone(buckets.spend('k', 1.0, 2.0))
+
+    def test_falls_back_to_memory_without_redis(self):
+        self.addCleanup(setattr, ratelimit, '_redis_down_until', 0.0)
+        with self.settings(REDIS_URL='redis://127.0.0.1:1/0'), self.assertLogs('blog.ratelimit', 'WARNING'):
+            self.assertIsNone(ratelimit.spend('write', 'user:1'))
+            self.assertIsNotNone(ratelimit.spend('write', 'user:1'))
+
+
+class ArchiveTestCase(TestCase):
+    def setUp(self):
+        self.post, self.other = PostFactory.create_batch(2)
+        self.comments = CommentFactory.create_batch(5, post=self.post)
+        CommentFactory(post=self.other)
+        # The three oldest comments, and the other post's, are past the archive age.
+        old = timezone.now() - timedelta(days=400)
+        Comment.objects.filter(pk__in=[c.id for c in self.comments[:3]]).update(created_at=old)
+        Comment.objects.filter(post=self.other).update(created_at=old)
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client = APIClient()
+        self.client.force_login(self.user)
+
+    def archive(self):
+        out = io.StringIO()
+        call_command('archive_comments', days=365, batch_size=2, stdout=out)
+        return out.getvalue()
+
+    def test_old_comments_moved(self):
+        self.assertIn('Archived 4 comments', self.archive())
+        self.assertEqual(list(Comment.objects.filter(post=self.post).values_list('id', flat=True)),
+                         [c.id for c in self.comments[3:]])
+        self.assertEqual(sorted(ArchivedComment.objects.filter(post=self.post).values_list('id', flat=True)),
+                         [c.id for c in self.comments[:3]])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 5)
+        self.assertIn('Archived 0 comments', self.archive())
+
+    def test_post_comments_span_both_tables(self):
+        self.archive()
+        ids, url = [], f'/api/posts/{self.post.id}/comments/?limit=2&expand=post'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual({c['post']['id'] for c in response.data['results']}, {self.post.id})
+            ids += [c['id'] for c in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, [c.id for c in self.comments])
+
+        results = self.client.get(f'/api/ninja/posts/{self.post.id}/comments?limit=10').json()['results']
+        self.assertEqual([c['id'] for c in results], [c.id for c in self.comments])
+        self.assertEqual(results[0], {'id': self.comments[0].id, 'post_id': self.post.id,
+                                      'text': self.comments[0].text, 'email': self.comments[0].email, 'post': None})
 
+    async def test_async_post_comments(self):
+        await sync_to_async(self.archive)()
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        response = await client.get(f'/api/ninja-async/posts/{self.post.id}/comments?limit=4')
+        page = response.json()
+        self.assertEqual([c['id'] for c in page['results']], [c.id for c in self.comments[:4]])
+        self.assertIsNotNone(page['next'])
 
-        
-        
-    
\ No newline at end of file
+    def test_post_delete_cascades(self):
+        self.archive()
+        self.post.delete()
+        self.assertFalse(ArchivedComment.objects.filter(post_id=self.post.id).exists())
+        self.assertTrue(ArchivedComment.objects.filter(post=self.other).exists())
@@ -1,7 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import PostListAPIView, CommentListAPIView, PostRetrieveAPIView, PostCreateAPIView, CommentCreateAPIView, PostUpdateAPIView, PostViewSet
+from .views import PostExportAPIView, CommentExportAPIView, PostCommentListAPIView, CacheStatsAPIView, MetricsAPIView
+from .views import PostBulkAPIView, CommentBulkAPIView, SearchAPIView, FeedAPIView
 from .views import api
+from .async_views import api as async_api
 
 router = DefaultRouter()
 router.register(r'articles', PostViewSet)
@@ -13,10 +16,20 @@ urlpatterns = [
     path('posts/create/', PostCreateAPIView.as_view(), name='post-create'),
     path('comments/create/', CommentCreateAPIView.as_view(), name='comment-create'),
     path('posts/<int:pk>/update/', PostUpdateAPIView.as_view(), name='post-update'),
+    path('posts/<int:pk>/comments/', PostCommentListAPIView.as_view(), name='post-comment-list'),
+    path('posts/export/', PostExportAPIView.as_view(), name='post-export'),
+    path('comments/export/', CommentExportAPIView.as_view(), name='comment-export'),
+    path('posts/bulk/', PostBulkAPIView.as_view(), name='post-bulk'),
+    path('comments/bulk/', CommentBulkAPIView.as_view(), name='comment-bulk'),
+    path('search/', SearchAPIView.as_view(), name='search'),
+    path('feed/', FeedAPIView.as_view(), name='feed'),
+    path('cache/stats/', CacheStatsAPIView.as_view(), name='cache-stats'),
+    path('metrics/', MetricsAPIView.as_view(), name='metrics'),
 ]
 
 urlpatterns += router.urls
 
 urlpatterns += [
     path('ninja/', api.urls),
+    path('ninja-async/', async_api.urls),
 ]
\ No newline at end of file
@@ -1,27 +1,82 @@
-from typing import List
+from datetime import datetime
+from uuid import UUID
+from typing import Any, Dict, List, Literal, Optional
 
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
-from ninja import NinjaAPI, Schema
+from ninja import Field, NinjaAPI, Query, Schema
+from ninja.errors import HttpError
+from ninja.pagination import paginate
+from pydantic import ValidationError as SchemaValidationError
 from rest_framework import generics, permissions, viewsets
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
 
+from . import pool
+from .archive import all_comments, post_comments
+from .bulk import (BatchError, bulk_create_comments, bulk_create_posts,
+                   bulk_delete_posts, bulk_result, bulk_update_posts,
+                   check_batch, item_error)
+from .cache import (CachedListMixin, CachedRetrieveMixin, cache_post_list,
+                    cache_stats, cached_post)
+
+from .conditional import (ConditionalListMixin, ConditionalRetrieveMixin,
+                          conditional, post_list_validators, post_validators)
+from .export import (COMMENT_EXPORT_FIELDS, EXPORT_FORMATS,
+                     POST_EXPORT_FIELDS, export_response)
+from .feed import feed_page
+from .fieldsets import (POST_FIELDS, RawListMixin, SparseFieldsMixin, columns,
+                        ninja_fields, raw_post_list, sparse_post_list)
+from .metrics import PrometheusTextRenderer, registry
 from .models import Comment, Post
-from .serializers import (CommentSerializer, PostSerializer,
-                          PostUpdateSerializer)
+from .pagination import (COMMENT_KEYSET, POST_KEYSET, CommentPagination,
+                         InvalidCursor, NinjaKeysetPagination, PostPagination,
+                         get_limit)
+from .ratelimit import RateLimited, rate_limited, rate_limited_response
+from .renderers import ninja_renderer
+from .search import search_page
+from .serializers import (CommentBulkSerializer, CommentQueueSerializer,
+                          CommentSerializer, CommentWithPostSerializer,
+                          PostBulkDeleteSerializer, PostBulkUpdateSerializer,
+                          PostSerializer, PostUpdateSerializer)
+from .writebehind import QUEUE_FULL, RETRY_AFTER, QueueFull, enqueue_comment
 
 
 # APIs Developed with Django Rest Framework
-class PostListAPIView(generics.ListAPIView):
+class PostListAPIView(ConditionalListMixin, RawListMixin, CachedListMixin, SparseFieldsMixin, generics.ListAPIView):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PostPagination
 
-class CommentListAPIView(generics.ListAPIView):
+class CommentReadMixin:
+    """Projected comment reads; `?expand=post` embeds a summary of each comment's post."""
     queryset = Comment.objects.all()
-    serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CommentPagination
+
+    def embeds_post(self):
+        return self.request.query_params.get('expand') == 'post'
+
+    def get_serializer_class(self):
+        return CommentWithPostSerializer if self.embeds_post() else CommentSerializer
+
+    def get_queryset(self):
+        return super().get_queryset().for_api(embed_post=self.embeds_post())
+
+class CommentListAPIView(CommentReadMixin, generics.ListAPIView):
+    pass
+
+class PostCommentListAPIView(CommentReadMixin, generics.ListAPIView):
+    def get_queryset(self):
+        post = get_object_or_404(Post.objects.only('id'), pk=self.kwargs['pk'])
+        return post_comments(post, self.embeds_post())
 
-class PostRetrieveAPIView(generics.RetrieveAPIView):
+class PostRetrieveAPIView(ConditionalRetrieveMixin, SparseFieldsMixin, CachedRetrieveMixin, generics.RetrieveAPIView):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -36,27 +91,170 @@ class CommentCreateAPIView(generics.CreateAPIView):
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def create(self, request, *args, **kwargs):
+        if not settings.BLOG_WRITE_BEHIND:
+            return super().create(request, *args, **kwargs)
+        serializer = CommentQueueSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            ticket = enqueue_comment({'post_id': data['post'], 'text': data['text'], 'email': data['email']})
+        except QueueFull:
+            return Response({'detail': QUEUE_FULL}, status=503, headers={'Retry-After': str(RETRY_AFTER)})
+        return Response({'id': ticket, 'status': 'queued'}, status=202)
+
 class PostUpdateAPIView(generics.UpdateAPIView):
     queryset = Post.objects.all()
     serializer_class = PostUpdateSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class PostViewSet(viewsets.ModelViewSet):
+class PostViewSet(ConditionalListMixin, ConditionalRetrieveMixin, CachedListMixin, SparseFieldsMixin,
+                  CachedRetrieveMixin, viewsets.ModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PostPagination
+
+class FeedAPIView(APIView):
+    """The latest posts with excerpts and comment counts, from the materialized feed (blog.feed)."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            body = feed_page(request, request.query_params.get('cursor'), request.query_params.get('limit'))
+        except InvalidCursor:
+            raise NotFound('Invalid cursor')
+        return HttpResponse(body, content_type='application/json')
+
+class ExportAPIView(APIView):
+    """Streams every row as NDJSON (default) or a JSON array: ?output=ndjson|json"""
+    queryset = None
+    export_fields = None
+    filename = None
+    permission_classes = [permissions.IsAuthenticated]
+    rate_budget = 'bulk'
+
+    def get(self, request):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            raise ValidationError({'output': f'Must be one of: {", ".join(EXPORT_FORMATS)}'})
+        return export_response(request._request, self.get_export_queryset(), self.export_fields, output,
+                               self.filename)
+
+    def get_export_queryset(self):
+        return self.queryset.all()
+
+class PostExportAPIView(ExportAPIView):
+    queryset = Post.objects.all()
+    export_fields = POST_EXPORT_FIELDS
+    filename = 'posts'
+
+class CommentExportAPIView(ExportAPIView):
+    """Streams every comment, archived ones included, in id order: ?output=ndjson|json"""
+    export_fields = COMMENT_EXPORT_FIELDS
+    filename = 'comments'
+
+    def get_export_queryset(self):
+        return all_comments()
+
+class BulkAPIView(APIView):
+    """Validates a JSON list item by item; valid items are written in one bulk statement."""
+    permission_classes = [permissions.IsAuthenticated]
+    rate_budget = 'bulk'
+
+    def bulk_write(self, request, serializer_class, write):
+        try:
+            check_batch(request.data)
+        except BatchError as e:
+            raise ValidationError({'non_field_errors': [str(e)]})
+        valid, errors = [], []
+        for index, item in enumerate(request.data):
+            serializer = serializer_class(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                errors.append(item_error(index, serializer.errors))
+        created, write_errors = write(valid) if valid else ([], [])
+        status, body = bulk_result(created, errors + write_errors)
+        return Response(body, status=status)
+
+class PostBulkAPIView(BulkAPIView):
+    def post(self, request):
+        return self.bulk_write(request, PostSerializer, bulk_create_posts)
+
+    def put(self, request):
+        return self.bulk_write(request, PostBulkUpdateSerializer, bulk_update_posts)
+
+    def delete(self, request):
+        return self.bulk_write(request, PostBulkDeleteSerializer, bulk_delete_posts)
+
+class CommentBulkAPIView(BulkAPIView):
+    def post(self, request):
+        return self.bulk_write(request, CommentBulkSerializer, bulk_create_comments)
+
+def search_next_link(request, page, has_next):
+    return replace_query_param(request.build_absolute_uri(), 'page', page + 1) if has_next else None
+
+class SearchAPIView(APIView):
+    """Ranked full-text search: ?q=<text>&scope=posts|comments&page=<n>&limit=<n>"""
+    permission_classes = [permissions.IsAuthenticated]
+    scopes = {
+        'posts': (Post, PostSerializer),
+        'comments': (Comment, CommentSerializer),
+    }
+
+    def get(self, request):
+        text = request.query_params.get('q', '').strip()
+        scope = request.query_params.get('scope', 'posts')
+        if not text:
+            raise ValidationError({'q': 'This query parameter is required.'})
+        if scope not in self.scopes:
+            raise ValidationError({'scope': f'Must be one of: {", ".join(self.scopes)}'})
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+        except ValueError:
+            raise ValidationError({'page': 'A valid integer is required.'})
+        model, serializer_class = self.scopes[scope]
+        items, has_next = search_page(model, text, page, get_limit(request.query_params.get('limit')))
+        return Response({
+            'next': search_next_link(request, page, has_next),
+            'results': serializer_class(items, many=True).data,
+        })
+
+class CacheStatsAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response(cache_stats())
+
+
+class MetricsAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [PrometheusTextRenderer]
+
+    def get(self, request):
+        return Response(registry.render() + pool.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 # APIs Developed with Django Ninja
-api = NinjaAPI()
+api = NinjaAPI(renderer=ninja_renderer())
+
+@api.exception_handler(RateLimited)
+def rate_limit_exceeded(request, exc):
+    return rate_limited_response(api, request, exc)
 
 class PostOutSchema(Schema):
-    id : int
-    title: str
-    content: str
+    # Every field is optional for ?fields=; handlers render it with exclude_unset.
+    id: int = None
+    title: str = None
+    excerpt: str = None
+    content: str = None
+    comment_count: int = None
+    created_at: datetime = None
+    updated_at: datetime = None
 
 class PostInSchema(Schema):
-    title: str = None
+    title: str = Field(None, max_length=200)
     content: str = None
 
 class CommentSchema(Schema):
@@ -64,19 +262,114 @@ class CommentSchema(Schema):
     text: str
     email: str
 
-@api.get('/posts', response=List[PostOutSchema], tags=['posts'], description="List all posts")
+class PostSummarySchema(Schema):
+    id: int
+    title: str
+    created_at: datetime
+
+class CommentOutSchema(CommentSchema):
+    id: int
+    post: Optional[PostSummarySchema] = None
+
+    @staticmethod
+    def resolve_post(obj):
+        # Set only when the list was asked for ?expand=post and joined the posts in.
+        return obj.post if Comment.post.is_cached(obj) else None
+
+class CommentCreatedSchema(Schema):
+    id: int
+
+class CommentQueuedSchema(Schema):
+    id: UUID
+    status: str
+
+class BulkItemSchema(Schema):
+    index: int
+    id: int
+
+class BulkErrorSchema(Schema):
+    index: int
+    errors: Dict[str, List[str]]
+
+class BulkResultSchema(Schema):
+    created: List[BulkItemSchema]
+    errors: List[BulkErrorSchema]
+
+class SearchPageSchema(Schema):
+    next: Optional[str] = None
+    results: List[Dict[str, Any]]
+
+class PostBulkInSchema(Schema):
+    title: str = Field(..., max_length=200)
+    content: str
+
+class PostBulkDeleteSchema(Schema):
+    id: int
+
+class PostBulkUpdateSchema(PostInSchema):
+    id: int
+
+def bulk_write(items, schema, write):
+    try:
+        check_batch(items)
+    except BatchError as e:
+        raise HttpError(400, str(e))
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, schema.model_validate(item).dict()))
+        except SchemaValidationError as e:
+            errors.append(item_error(index, {'.'.join(map(str, error['loc'])) or 'non_field_errors': [error['msg']]
+                                             for error in e.errors()}))
+    created, write_errors = write(valid) if valid else ([], [])
+    return bulk_result(created, errors + write_errors)
+
+@api.get('/posts', response=List[PostOutSchema], exclude_unset=True, tags=['posts'], description="List all posts")
+@rate_limited('read')
 @login_required()
-def list_posts(request):
-    queryset = Post.objects.all()
-    return queryset
+@conditional(post_list_validators)
+@raw_post_list(Post.objects.all())
+@cache_post_list(PostOutSchema)
+@sparse_post_list
+@paginate(NinjaKeysetPagination, keyset=POST_KEYSET)
+def list_posts(request, response: HttpResponse, fields: str = None, raw: bool = False):
+    """
+    - **fields**: comma-separated post fields to return, e.g. `id,title,excerpt`
+    - **raw**: return `{next, fields, results}` with one array of values per post
+    """
+    return Post.objects.values(*columns(ninja_fields(fields)))
 
-@api.get("/comments", response=List[CommentSchema], tags=['comments'], description="List all comments")
+@api.get("/comments", response=List[CommentOutSchema], tags=['comments'], description="List all comments")
+@rate_limited('read')
 @login_required
-def list_comments(request):
-    queryset = Comment.objects.all()
-    return queryset
+@paginate(NinjaKeysetPagination, keyset=COMMENT_KEYSET)
+def list_comments(request, expand: Literal['post'] = None):
+    return Comment.objects.for_api(embed_post=expand == 'post')
+
+@api.get("/feed", tags=['posts'], description="The latest posts with excerpts and comment counts")
+@rate_limited('read')
+@login_required
+def get_feed(request, cursor: str = None, limit: int = Query(None, ge=1)):
+    try:
+        return HttpResponse(feed_page(request, cursor, limit), content_type='application/json')
+    except InvalidCursor:
+        raise HttpError(404, 'Invalid cursor')
+
+@api.get("/posts/export", tags=['posts'], description="Stream all posts as NDJSON or a JSON array")
+@rate_limited('bulk')
+@login_required
+def export_posts(request, output: Literal['ndjson', 'json'] = 'ndjson'):
+    return export_response(request, Post.objects.all(), POST_EXPORT_FIELDS, output, 'posts')
+
+@api.get("/comments/export", tags=['comments'],
+         description="Stream all comments, archived ones included, as NDJSON or a JSON array")
+@rate_limited('bulk')
+@login_required
+def export_comments(request, output: Literal['ndjson', 'json'] = 'ndjson'):
+    return export_response(request, all_comments(), COMMENT_EXPORT_FIELDS, output, 'comments')
 
 @api.post("/posts", tags=['posts'])
+@rate_limited('write')
 @login_required
 def create_post(request, payload: PostInSchema):
     """
@@ -87,7 +380,8 @@ def create_post(request, payload: PostInSchema):
     post = Post.objects.create(**payload.dict())
     return {"id": post.id}
 
-@api.post("/comments", tags=['comments'])
+@api.post("/comments", response={200: CommentCreatedSchema, 202: CommentQueuedSchema}, tags=['comments'])
+@rate_limited('write')
 @login_required
 def create_comment(request, payload: CommentSchema):
     """
@@ -95,11 +389,66 @@ def create_comment(request, payload: CommentSchema):
     - **post_id**
     - **text**
     - **email**
+
+    With write-behind on, the comment is queued and the answer is a 202 with its ticket.
     """
+    if settings.BLOG_WRITE_BEHIND:
+        try:
+            return 202, {"id": enqueue_comment(payload.dict()), "status": "queued"}
+        except QueueFull:
+            response = api.create_response(request, {"detail": QUEUE_FULL}, status=503)
+            response['Retry-After'] = str(RETRY_AFTER)
+            return response
     comment = Comment.objects.create(**payload.dict())
     return {"id": comment.id}
 
+@api.post("/posts/bulk", response={201: BulkResultSchema, 207: BulkResultSchema}, tags=['posts'])
+@rate_limited('bulk')
+@login_required
+def bulk_create_post(request, payload: List[Dict[str, Any]]):
+    """
+    To create many posts in one request please provide a list of:
+    - **title**
+    - **content**
+    """
+    return bulk_write(payload, PostBulkInSchema, bulk_create_posts)
+
+@api.put("/posts/bulk", response={201: BulkResultSchema, 207: BulkResultSchema}, tags=['posts'])
+@rate_limited('bulk')
+@login_required
+def bulk_update_post(request, payload: List[Dict[str, Any]]):
+    """
+    To update many posts in one request please provide a list of:
+    - **id**
+    - **title**
+    - **content**
+    """
+    return bulk_write(payload, PostBulkUpdateSchema, bulk_update_posts)
+
+@api.delete("/posts/bulk", response={201: BulkResultSchema, 207: BulkResultSchema}, tags=['posts'])
+@rate_limited('bulk')
+@login_required
+def bulk_delete_post(request, payload: List[Dict[str, Any]]):
+    """
+    To delete many posts in one request please provide a list of:
+    - **id**
+    """
+    return bulk_write(payload, PostBulkDeleteSchema, bulk_delete_posts)
+
+@api.post("/comments/bulk", response={201: BulkResultSchema, 207: BulkResultSchema}, tags=['comments'])
+@rate_limited('bulk')
+@login_required
+def bulk_create_comment(request, payload: List[Dict[str, Any]]):
+    """
+    To create many comments in one request please provide a list of:
+    - **post_id**
+    - **text**
+    - **email**
+    """
+    return bulk_write(payload, CommentSchema, bulk_create_comments)
+
 @api.put("/posts/{int:post_id}", tags=['posts'])
+@rate_limited('write')
 @login_required
 def update_post(request, post_id: int, payload: PostInSchema):
     """
@@ -115,15 +464,45 @@ def update_post(request, post_id: int, payload: PostInSchema):
     post.save()
     return {"success": True}
 
-@api.get("/posts/{int:post_id}", response=PostOutSchema, tags=['posts'], description="Get a post")
+@api.get("/posts/{int:post_id}/comments", response=List[CommentOutSchema], tags=['comments'], description="List the comments of a post")
+@rate_limited('read')
 @login_required
-def get_post(request, post_id: int):
-    post = get_object_or_404(Post, id=post_id)
-    return post
+@paginate(NinjaKeysetPagination, keyset=COMMENT_KEYSET)
+def list_post_comments(request, post_id: int, expand: Literal['post'] = None):
+    post = get_object_or_404(Post.objects.only('id'), id=post_id)
+    return post_comments(post, embed_post=expand == 'post')
+
+@api.get("/posts/{int:post_id}", response=PostOutSchema, exclude_unset=True, tags=['posts'], description="Get a post")
+@rate_limited('read')
+@login_required
+@conditional(post_validators)
+def get_post(request, post_id: int, response: HttpResponse, fields: str = None):
+    fields = ninja_fields(fields) or POST_FIELDS
+    return cached_post(post_id, f"ninja:{','.join(fields)}",
+                       lambda: get_object_or_404(Post.objects.values(*fields), id=post_id))
 
 @api.delete("/posts/{int:post_id}", tags=['posts'], description="Delete a post")
+@rate_limited('write')
 @login_required
 def delete_post(request, post_id: int):
     post = get_object_or_404(Post, id=post_id)
     post.delete()
-    return {"success": True}
\ No newline at end of file
+    return {"success": True}
+
+@api.get("/search", response=SearchPageSchema, tags=['search'], description="Ranked full-text search")
+@rate_limited('read')
+@login_required
+def search(request, q: str, scope: Literal['posts', 'comments'] = 'posts',
+           page: int = Query(1, ge=1), limit: int = Query(None, ge=1)):
+    model, schema = {'posts': (Post, PostOutSchema), 'comments': (Comment, CommentOutSchema)}[scope]
+    items, has_next = search_page(model, q, page, get_limit(limit))
+    return {
+        'next': search_next_link(request, page, has_next),
+        'results': [schema.from_orm(item).dict() for item in items],
+    }
+
+@api.get("/cache/stats", tags=['cache'], description="Post cache hit/miss counters")
+@rate_limited('read')
+@login_required
+def get_cache_stats(request):
+    return cache_stats()
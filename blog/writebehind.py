@@ -0,0 +1,193 @@
+"""
+Write-behind comment ingestion.
+
+With BLOG_WRITE_BEHIND on, the comment create endpoints validate the payload,
+append it to a durable queue and answer 202 with a ticket instead of inserting
+on the request thread. `manage.py flush_comments` drains the queue into the
+database with bulk_create, a batch at a time.
+
+The queue is a Redis list when REDIS_URL is set, otherwise an SQLite journal
+on local disk (BLOG_COMMENT_QUEUE_PATH), which is only shared by processes on
+the same host. Either way an accepted comment survives a restart of the web
+or flusher processes. Delivery is at least once: a batch claimed by a flusher
+that dies before acknowledging it is claimed again, and tickets that already
+made it into the database are skipped (Comment.ticket is unique).
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+
+from .bulk import bulk_create_comments
+from .models import Comment
+
+logger = logging.getLogger('blog.writebehind')
+
+QUEUE_KEY = 'blog:comments:queue'
+# What a client is told when the queue is at BLOG_COMMENT_QUEUE_MAX.
+QUEUE_FULL = 'Too many comments are waiting to be written, retry later.'
+RETRY_AFTER = 5
+
+
+class QueueFull(Exception):
+    pass
+
+
+class RedisQueue:
+    # Checks the length and pushes in one step, so concurrent writers cannot overshoot the limit.
+    PUSH = """
+        if redis.call('LLEN', KEYS[1]) >= tonumber(ARGV[2]) then return 0 end
+        redis.call('LPUSH', KEYS[1], ARGV[1])
+        return 1
+    """
+
+    def __init__(self, url, key=QUEUE_KEY):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.key = key
+        self._push = self.client.register_script(self.PUSH)
+
+    def _processing(self, consumer):
+        return f'{self.key}:processing:{consumer}'
+
+    def push(self, item, limit):
+        if not self._push(keys=[self.key], args=[json.dumps(item), limit]):
+            raise QueueFull
+
+    def size(self):
+        return self.client.llen(self.key)
+
+    def claim(self, count, consumer):
+        """Moves up to `count` of the oldest items to this consumer's processing list."""
+        pipe = self.client.pipeline()
+        for _ in range(count):
+            pipe.lmove(self.key, self._processing(consumer), 'RIGHT', 'LEFT')
+        return [json.loads(raw) for raw in pipe.execute() if raw is not None]
+
+    def ack(self, consumer):
+        self.client.delete(self._processing(consumer))
+
+    def recover(self, consumer):
+        """Returns a batch left claimed by a consumer that died, oldest first, to the queue."""
+        while self.client.lmove(self._processing(consumer), self.key, 'LEFT', 'RIGHT') is not None:
+            pass
+
+
+class SQLiteQueue:
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        with self.transaction() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS queue ('
+                       'id INTEGER PRIMARY KEY AUTOINCREMENT, item TEXT NOT NULL, consumer TEXT)')
+
+    def transaction(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = self.local.db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=FULL')
+        return _Transaction(db)
+
+    def push(self, item, limit):
+        with self.transaction() as db:
+            if db.execute('SELECT count(*) FROM queue').fetchone()[0] >= limit:
+                raise QueueFull
+            db.execute('INSERT INTO queue (item) VALUES (?)', [json.dumps(item)])
+
+    def size(self):
+        with self.transaction() as db:
+            return db.execute('SELECT count(*) FROM queue').fetchone()[0]
+
+    def claim(self, count, consumer):
+        with self.transaction() as db:
+            rows = db.execute('SELECT id, item FROM queue WHERE consumer IS NULL ORDER BY id LIMIT ?',
+                              [count]).fetchall()
+            db.executemany('UPDATE queue SET consumer = ? WHERE id = ?', [(consumer, id_) for id_, _ in rows])
+        return [json.loads(item) for _, item in rows]
+
+    def ack(self, consumer):
+        with self.transaction() as db:
+            db.execute('DELETE FROM queue WHERE consumer = ?', [consumer])
+
+    def recover(self, consumer):
+        with self.transaction() as db:
+            db.execute('UPDATE queue SET consumer = NULL WHERE consumer = ?', [consumer])
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, so a count-then-insert or select-then-claim is atomic across processes."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, *args):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+@lru_cache(maxsize=None)
+def _open(redis_url, path):
+    return RedisQueue(redis_url) if redis_url else SQLiteQueue(path)
+
+
+def get_queue():
+    return _open(settings.REDIS_URL, str(settings.BLOG_COMMENT_QUEUE_PATH))
+
+
+def enqueue_comment(data):
+    """Queues validated `{post_id, text, email}` and returns its ticket. Raises QueueFull."""
+    ticket = uuid.uuid4()
+    get_queue().push({**data, 'ticket': str(ticket)}, settings.BLOG_COMMENT_QUEUE_MAX)
+    return ticket
+
+
+def flush(batch_size, consumer='default'):
+    """Writes one batch from the queue to the database; returns the number of items it took."""
+    queue = get_queue()
+    items = queue.claim(batch_size, consumer)
+    if not items:
+        return 0
+    tickets = [uuid.UUID(item['ticket']) for item in items]
+    # Tickets already written were redelivered after a flusher died before its ack.
+    written = set(Comment.objects.filter(ticket__in=tickets).values_list('ticket', flat=True))
+    valid = [(index, {**item, 'ticket': ticket})
+             for index, (item, ticket) in enumerate(zip(items, tickets)) if ticket not in written]
+    _, errors = bulk_create_comments(valid)
+    for error in errors:
+        logger.warning('Dropped queued comment %s: %s', tickets[error['index']], error['errors'])
+    queue.ack(consumer)
+    return len(items)
+
+
+def drain(batch_size, consumer='default', stop=lambda: False, interval=1.0):
+    """
+    Flushes until `stop()` is true, sleeping `interval` seconds whenever the
+    queue is empty. Then flushes everything queued up to that point, so that
+    comments accepted before a shutdown are written before the flusher exits.
+    """
+    queue = get_queue()
+    queue.recover(consumer)
+    total = 0
+    while not stop():
+        flushed = flush(batch_size, consumer)
+        total += flushed
+        if not flushed:
+            time.sleep(interval)
+    remaining = queue.size()
+    while remaining > 0:
+        flushed = flush(batch_size, consumer)
+        if not flushed:
+            break
+        total += flushed
+        remaining -= flushed
+    return total
@@ -0,0 +1,49 @@
+"""
+Gunicorn settings for `manage.py serve` (or `gunicorn -c config/gunicorn.conf.py config.wsgi`).
+
+Everything can be overridden from the environment. The app is loaded once in
+the master and forked (SERVER_PRELOAD), so workers share its memory pages
+copy-on-write. Because of that, `kill -HUP` only re-reads this file and
+replaces the workers; to deploy new code send USR2 (a new master with the new
+code starts next to the old one) and then TERM to the old master.
+"""
+import os
+
+interface = os.environ.get('SERVER_INTERFACE', 'wsgi')
+# The cores this container may run on, which can be fewer than the host has.
+cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+
+bind = os.environ.get('SERVER_BIND', '0.0.0.0:8000')
+if interface == 'asgi':
+    # An event loop per core; one worker already keeps a core busy.
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    workers = int(os.environ.get('WEB_CONCURRENCY', cores))
+else:
+    # Threaded workers: the sync worker does not support keep-alive.
+    worker_class = 'gthread'
+    workers = int(os.environ.get('WEB_CONCURRENCY', cores * 2 + 1))
+    threads = int(os.environ.get('SERVER_THREADS', 2))
+
+preload_app = os.environ.get('SERVER_PRELOAD', 'true').lower() in ('1', 'true', 'yes', 'on')
+# Longer than the idle timeout of a load balancer in front, so it never reuses a closed socket.
+keepalive = int(os.environ.get('SERVER_KEEPALIVE', 75))
+timeout = int(os.environ.get('SERVER_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 30))
+# Recycle workers now and then, at staggered times, to bound slow memory growth.
+max_requests = int(os.environ.get('SERVER_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+accesslog = os.environ.get('SERVER_ACCESS_LOG') or None
+forwarded_allow_ips = os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1')
+
+
+def pre_fork(server, worker):
+    # Connections opened while preloading must not be inherited: a worker closing its
+    # copy would end the session for every other process sharing the socket.
+    if server.cfg.preload_app:
+        from django.db import connections
+
+        from blog import pool
+
+        connections.close_all()
+        pool.close_all()